@@ -0,0 +1,98 @@
+# Các phép đo hiệu năng.
+# Cách dùng: python benchmark.py concat <clip1> <clip2> ...   (so sánh các engine ghép)
+#            python benchmark.py startup be_ca bluey ...       (chi phí khởi động mỗi lần chạy script kênh)
+#            python benchmark.py probe <file1> <file2> ...     (độ trễ đọc thời lượng mỗi file, nên chạy trên đường dẫn NAS)
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import video_probe
+from video_tools import concat_two_stage, concat_filter, concat_pipeline, job_workspace, NORMALIZE_PARAMS
+from video_probe import ffprobe_video, probe_cached
+from mp4_header import read_info
+
+
+def bench_concat(input_videos):
+    engines = {
+        # cache tắt để so sánh công bằng: engine nào cũng encode lại toàn bộ
+        "two_stage": lambda out, workdir: concat_two_stage(input_videos, out, workdir, use_cache=False),
+        "filter_complex": lambda out, workdir: concat_filter(input_videos, out, **NORMALIZE_PARAMS),
+        "pipeline": lambda out, workdir: concat_pipeline(input_videos, out, workdir),
+    }
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_concat_") as out_dir:
+        for name, run in engines.items():
+            output_path = os.path.join(out_dir, f"{name}.mp4")
+            start = time.perf_counter()
+            with job_workspace() as workdir:
+                run(output_path, workdir)
+            elapsed = time.perf_counter() - start
+            results.append((name, elapsed, os.path.getsize(output_path)))
+
+    print(f"\n{len(input_videos)} clip(s):")
+    for name, elapsed, size in results:
+        print(f"  {name:<16} {elapsed:8.1f}s  {size / 1024 ** 2:8.1f} MB")
+
+
+def bench_startup(script_names):
+    # Mỗi lần main_loop chạy subprocess phải trả: khởi động interpreter + import pandas/gspread/...
+    # Chế độ daemon chỉ trả một lần lúc khởi động.
+    here = os.path.dirname(os.path.abspath(__file__))
+    print("Thời gian khởi động + import mỗi script kênh (tiến trình mới):")
+    for name in script_names:
+        module = os.path.splitext(name)[0]
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], cwd=here, check=True)
+        print(f"  {module:<16} {time.perf_counter() - start:6.2f}s")
+
+
+def _moviepy_duration(path):
+    from moviepy import VideoFileClip  # chỉ để so sánh, runner không còn import moviepy
+    with VideoFileClip(path) as video:
+        return video.duration
+
+
+def bench_probe(paths):
+    # cache probe riêng, trống: nếu dùng PROBE_DB thật thì lần probe_cached đầu cũng là cache hit
+    db_dir = tempfile.mkdtemp(prefix="bench_probe_")
+    video_probe.PROBE_DB = os.path.join(db_dir, "probe.sqlite")
+    readers = {
+        "ffprobe": ffprobe_video,
+        "mp4_header": read_info,
+        "probe_cached": probe_cached,  # lần 1 điền cache, lần 2 đọc từ cache
+        "probe_cached(hit)": probe_cached,
+    }
+    try:
+        import moviepy  # noqa: F401
+        readers["moviepy"] = _moviepy_duration
+    except ImportError:
+        print("(không có moviepy, bỏ qua)")
+
+    print(f"Độ trễ đọc thời lượng trung bình / file ({len(paths)} file):")
+    for name, read in readers.items():
+        start = time.perf_counter()
+        for path in paths:
+            read(path)
+        elapsed = time.perf_counter() - start
+        print(f"  {name:<18} {elapsed / len(paths) * 1000:8.1f} ms")
+
+    conn = getattr(video_probe._local, "conn", None)
+    if conn is not None:
+        conn.close()  # Windows không xóa được file sqlite đang mở
+        video_probe._local.conn = None
+    shutil.rmtree(db_dir, ignore_errors=True)
+
+
+BENCHMARKS = {
+    "concat": bench_concat,
+    "startup": bench_startup,
+    "probe": bench_probe,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in BENCHMARKS:
+        print(f"Cách dùng: python benchmark.py [{'|'.join(BENCHMARKS)}] <file> ...")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](sys.argv[2:])
@@ -1,13 +1,16 @@
 import pandas as pd
-import numpy as np
-import random
 import os
-import gspread
-from google.oauth2.service_account import Credentials
-from module6 import auto_concat, find_first_vid, excel_to_sheet 
+import sys
+from sheet_client import get_client
+from catalog import load_cached
+from catalog_store import load_arrays
+from selection import eligible_indexes, freshness_weights, plan_rows
+from used_journal import UsedJournal
+from module6 import auto_concat, find_first_vids, excel_to_sheet 
+from video_tools import exit_code
 
 
-EXCEL_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\temp.xlsx"
+EXCEL_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\temp_bluey_funtoys.xlsx"  # riêng từng kênh để chạy song song
 CSV_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\bluey_funtoys_data.csv"
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
@@ -16,21 +19,13 @@ SCOPES = [
 CREDS_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\sheet.json" 
 SHEET_NAME = 'Auto_concat_vids_ver2'  
 OUTPUT_DIR = r"E:\ghep_\bluey_funtoys"
-MAX_AGE_SECONDS = 55 * 24 * 60 * 60  * 0 
+CONCAT_ENGINE = "two_stage"  # "two_stage", "filter_complex" hoặc "pipeline"
+SELECTION_MODE = "pack"  # "pack" (sát desired length) hoặc "random"
+SELECTION_WEIGHTS = "fresh"  # "fresh" (ưu tiên clip lâu chưa dùng) hoặc "uniform"
 USED_LOG_FILE = r"C:\Users\Admin\Documents\concatenate videos\log_file\bluey_funtoys.log"
 SHEET_INDEX = 2
 
 
-def load_used_videos():
-    if os.path.exists(USED_LOG_FILE):
-        with open(USED_LOG_FILE, 'r', encoding='utf-8') as f:
-            return set(line.strip() for line in f if line.strip())
-    return set()
-
-def save_used_videos(used_set):
-    with open(USED_LOG_FILE, 'w', encoding='utf-8') as f:
-        for path in used_set:
-            f.write(f"{path}\n")
 
 ############ UPDATE EXCEL DATA #############
 def clear_excel_file(excel_file):
@@ -88,13 +83,15 @@ def convert_time_to_seconds(time_str):
     except:
         return 0
 
+def read_original_data(csv_file):
+    # đọc từ catalog SQLite (giây kiểu int), tự migrate lại khi CSV thay đổi
+    durations, last_used, file_paths = load_arrays(csv_file)
+    df = pd.DataFrame({'file_path': file_paths, 'duration': durations, 'lastest_used_value': last_used})
+    return durations, last_used, file_paths, df
+
 def prepare_original_data():
     try:
-        df = pd.read_csv(CSV_FILE, encoding='utf-8-sig')
-        durations = np.array([convert_time_to_seconds(d) for d in df['duration']])
-        last_used = np.array([convert_time_to_seconds(t) for t in df['lastest_used_value']])
-        file_paths = df['file_path'].tolist()
-        return durations, last_used, file_paths, df
+        return load_cached(CSV_FILE, read_original_data)
     except FileNotFoundError:
         print(f"Error: CSV file '{CSV_FILE}' not found.")
         return None, None, None, None
@@ -105,46 +102,6 @@ def prepare_original_data():
         print(f"Unexpected error reading CSV: {str(e)}")
         return None, None, None, None
 
-def generate_video_lists(suitable_df, durations, last_used, file_paths):
-    results = []
-    for i in range(len(suitable_df)):
-        num_lists = 1  # Force number_of_vids to 1
-        desired_length = float(suitable_df.iloc[i]['desired length']) * 60
-        first_vid_number = int(suitable_df.iloc[i]['first vids'])
-
-        first_vd = find_first_vid(first_vid_number)
-        first_path, first_duration = first_vd[0], convert_time_to_seconds(first_vd[1])
-        if not first_path:
-            print(f"Không tìm thấy video đầu tiên cho {first_vid_number}")
-            continue
-
-        for list_index in range(num_lists):
-            available_indexes = [
-                idx for idx in range(len(file_paths))
-                if last_used[idx] >= MAX_AGE_SECONDS
-            ]
-
-            total_duration = first_duration
-            selected_indexes = []
-            selected_paths = [first_path]
-
-            while available_indexes and total_duration < desired_length:
-                chosen_index = random.choice(available_indexes)
-                total_duration += durations[chosen_index]
-                selected_indexes.append(chosen_index)
-                selected_paths.append(file_paths[chosen_index])
-                available_indexes.remove(chosen_index)
-
-            results.append({
-                'name': first_vid_number,
-                'group_index': i,
-                'list_number': list_index + 1,
-                'selected_files': selected_paths,
-                'total_duration': total_duration
-            })
-
-    return results
-
 def format_and_print_results(results):
     for item in results:
         minutes = int(item['total_duration']) // 60
@@ -157,21 +114,10 @@ def format_and_print_results(results):
     
 def main():
 
-    def load_used_videos():
-        if os.path.exists(USED_LOG_FILE):
-            with open(USED_LOG_FILE, 'r', encoding='utf-8') as f:
-                return set(line.strip() for line in f if line.strip())
-        return set()
-
-    def save_used_videos(used_set):
-        with open(USED_LOG_FILE, 'w', encoding='utf-8') as f:
-            for path in used_set:
-                f.write(f"{path}\n")
 
     
     try:
-        creds = Credentials.from_service_account_file(CREDS_FILE, scopes=SCOPES)
-        gc = gspread.authorize(creds)
+        gc = get_client(CREDS_FILE)
         copy_from_ggsheet_to_excel(gc, SHEET_NAME, EXCEL_FILE)
     except Exception as e:
         print(f"Error in main execution: {e}")
@@ -189,53 +135,55 @@ def main():
             print("Failed to load data from CSV. Exiting.")
             return
 
-        used_video_paths = load_used_videos()
+        journal = UsedJournal(USED_LOG_FILE)
+        used_video_paths, use_counts = journal.load()
+        reset_log = False
         results = []
         newly_used_paths = set()
+        # Tìm video đầu cho mọi dòng trong một lần quét thư mục
+        first_vids = find_first_vids(int(n) for n in suitable_df['first vids'])
 
+        rows = []  # (group_index, first_vid_number, first_path, first_duration, desired_length)
         for i in range(len(suitable_df)):
-            num_lists = 1
             desired_length = float(suitable_df.iloc[i]['desired length']) * 60
             first_vid_number = int(suitable_df.iloc[i]['first vids'])
 
-            first_vd = find_first_vid(first_vid_number)
+            first_vd = first_vids[first_vid_number]
             first_path, first_duration = first_vd[0], convert_time_to_seconds(first_vd[1])
             if not first_path:
                 print(f"Không tìm thấy video đầu tiên cho {first_vid_number}")
                 continue
-
-            for list_index in range(num_lists):
-                available_indexes = [
-                    idx for idx in range(len(file_paths))
-                    if file_paths[idx] not in used_video_paths
-                ]
-
-                # Reset nếu đã dùng hết
-                if not available_indexes:
-                    print("Đã dùng hết video, reset log.")
-                    used_video_paths.clear()
-                    available_indexes = list(range(len(file_paths)))
-
-                total_duration = first_duration
-                selected_paths = [first_path]
-                newly_used_paths.add(first_path)
-
-                while available_indexes and total_duration < desired_length:
-                    chosen_index = random.choice(available_indexes)
-                    path = file_paths[chosen_index]
-                    if path not in used_video_paths:
-                        total_duration += durations[chosen_index]
-                        selected_paths.append(path)
-                        newly_used_paths.add(path)
-                    available_indexes.remove(chosen_index)
-
-                results.append({
-                    'name': first_vid_number,
-                    'group_index': i,
-                    'list_number': list_index + 1,
-                    'selected_files': selected_paths,
-                    'total_duration': total_duration
-                })
+            rows.append((i, first_vid_number, first_path, first_duration, desired_length))
+
+        # Video đầu của các dòng không được chọn lại làm clip ghép
+        first_paths = {row[2] for row in rows}
+        available_indexes = eligible_indexes(file_paths, used_video_paths | first_paths)
+        targets = [row[4] - row[3] for row in rows]
+        # Reset nếu clip chưa dùng không đủ thời lượng cho cả batch (kể cả khi đã dùng hết)
+        if rows and durations[available_indexes].sum() < sum(max(t, 0) for t in targets):
+            print("Clip chưa dùng không đủ cho mọi dòng, reset log.")
+            used_video_paths.clear()
+            reset_log = True
+            available_indexes = eligible_indexes(file_paths, first_paths)
+
+        # Lập playlist cho mọi dòng cùng lúc, các dòng không dùng trùng clip
+        # số lần đã dùng lấy từ toàn bộ lịch sử journal (kể cả trước các lần reset)
+        weights = None
+        if SELECTION_WEIGHTS == "fresh":
+            weights = freshness_weights(last_used, [use_counts.get(p, 0) for p in file_paths])
+        picks = plan_rows(durations, available_indexes, targets, mode=SELECTION_MODE, weights=weights)
+        for (i, first_vid_number, first_path, first_duration, _), chosen in zip(rows, picks):
+            selected_paths = [first_path] + [file_paths[idx] for idx in chosen]
+            selected_durations = [first_duration] + durations[chosen].tolist()
+            newly_used_paths.update(selected_paths)
+            results.append({
+                'name': first_vid_number,
+                'group_index': i,
+                'list_number': 1,
+                'selected_files': selected_paths,
+                'selected_durations': selected_durations,
+                'total_duration': sum(selected_durations)
+            })
 
         if not results:
             print("No video lists generated.")
@@ -258,7 +206,8 @@ def main():
         name = ls['name']
         filename = f"{name}_Bluey_funtoys_ghep.mp4"
         output_path = os.path.join(OUTPUT_DIR, filename)
-        auto_concat(ls['selected_files'], output_path)
+        auto_concat(ls['selected_files'], output_path, engine=CONCAT_ENGINE,
+                    durations=ls['selected_durations'])
 
         group_index = ls['group_index']
         row_index = suitable_df.index[group_index]
@@ -273,6 +222,7 @@ def main():
         original_df.at[row_index, 'number_of_vids'] = 1
 
     #Lưu file Excel & cập nhật Google Sheet
+    sheet_error = None
     try:
         if 'number_of_vids' in original_df.columns:
             original_df = original_df.drop(columns=['number_of_vids'])
@@ -282,11 +232,17 @@ def main():
         print("Updated Google Sheet.")
     except Exception as e:
         print(f"Error: {e}")
+        sheet_error = e
 
-    #Lưu log video đã dùng
-    used_video_paths.update(newly_used_paths)
-    save_used_videos(used_video_paths)
+    #Lưu log video đã dùng (chỉ ghi nối các path mới)
+    if reset_log:
+        journal.reset()
+    journal.append(newly_used_paths)
+    if sheet_error is not None:
+        # status trên Sheet vẫn là 'auto': báo lỗi để runner dừng task, không encode lại các dòng này mãi
+        raise RuntimeError(f"Không cập nhật được Google Sheet: {sheet_error}") from sheet_error
+    return len(results)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(exit_code(main()))
@@ -0,0 +1,119 @@
+import os
+import csv
+import shutil
+import threading
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def load_cached(path, loader):
+    """
+    Trả về loader(path), nhớ kết quả tới khi file đổi size/mtime. Trong daemon
+    các CSV catalog chỉ bị đọc/parse lại khi thực sự thay đổi.
+    """
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _lock:
+        hit = _cache.get(path)
+        if hit and hit[0] == stamp:
+            return hit[1]
+    value = loader(path)
+    with _lock:
+        _cache[path] = (stamp, value)
+    return value
+
+
+CATALOG_COLUMNS = ['stt', 'file_path', 'duration', 'lastest_used_value']
+
+
+def atomic_write(path, write):
+    """Gọi write(tmp_path) rồi os.replace sang path: bị ngắt giữa chừng thì file cũ vẫn nguyên."""
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.{os.getpid()}.tmp{ext}"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def append_rows_csv(path, rows, columns=CATALOG_COLUMNS):
+    """
+    Nối rows vào cuối CSV catalog. Header đúng columns thì chép nguyên byte file cũ rồi ghi thêm,
+    không parse lại toàn bộ; header khác thì chuẩn hóa về columns.
+    Header và dòng mới dùng cùng kiểu xuống dòng với file cũ (CRLF hay LF tùy máy đã ghi bằng df.to_csv).
+    """
+    def write(tmp):
+        with open(tmp, 'w', encoding='utf-8-sig', newline='') as out:
+            if not os.path.exists(path):
+                writer = csv.writer(out, lineterminator=os.linesep)  # như df.to_csv mặc định
+                writer.writerow(columns)
+            else:
+                with open(path, encoding='utf-8-sig', newline='') as f:
+                    first = f.readline()
+                    writer = csv.writer(out, lineterminator=_line_terminator(first))
+                    header = next(csv.reader([first]), None)
+                    if header == columns:
+                        writer.writerow(columns)
+                        shutil.copyfileobj(f, out)
+                        if out.tell() and not _ends_with_newline(path):
+                            out.write(writer.dialect.lineterminator)
+                    else:
+                        f.seek(0)
+                        writer.writerow(columns)
+                        for old in csv.DictReader(f):
+                            writer.writerow([old.get(c, '') for c in columns])
+            writer.writerows(rows)
+    atomic_write(path, write)
+
+
+def _line_terminator(line):  # kiểu xuống dòng của dòng header file cũ
+    if line.endswith('\r\n'):
+        return '\r\n'
+    if line.endswith('\n'):
+        return '\n'
+    return os.linesep
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) in (b'\n', b'\r')
+
+
+class BatchWriter:
+    """Gom các dòng mới, ghi một lần bằng append(path, rows) mỗi flush_every dòng và khi kết thúc."""
+
+    def __init__(self, path, append=append_rows_csv, flush_every=200):
+        self.path = path
+        self.append = append
+        self.flush_every = flush_every
+        self.rows = []
+
+    def add(self, values):
+        self.rows.append(list(values))
+        if self.flush_every and len(self.rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return 0
+        try:
+            self.append(self.path, self.rows)
+        except Exception as e:
+            print(f"Error writing to '{self.path}': {e}")
+            return 0  # giữ lại rows, lần flush sau thử lại
+        written, self.rows = len(self.rows), []
+        return written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        return False
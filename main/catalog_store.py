@@ -0,0 +1,107 @@
+import os
+import csv
+import sys
+import glob
+import time
+import sqlite3
+from contextlib import closing
+import numpy as np
+
+# Catalog có kiểu: file SQLite cạnh mỗi ref/*.csv, thời lượng và lastest_used_value lưu số nguyên giây.
+# CSV vẫn là nguồn (GUI / watcher ghi vào); khi CSV đổi size/mtime thì migrate lại,
+# còn lại loader đọc thẳng ra mảng NumPy, không phải parse "m:ss" từng dòng.
+# Migrate tay: python catalog_store.py [file.csv ...]   (mặc định toàn bộ ref/*.csv)
+REF_DIR = r"C:\Users\Admin\Documents\concatenate videos\ref"
+SCHEMA_VERSION = 1
+
+
+def store_path(csv_file):
+    return os.path.splitext(csv_file)[0] + ".sqlite"
+
+
+def to_seconds(value):  # "m:ss" / "h:mm:ss" / số -> int giây, lỗi thì 0
+    try:
+        text = str(value).strip()
+        if not text:
+            return 0
+        if ':' not in text:
+            return int(float(text))
+        seconds = 0
+        for part in text.split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    except (TypeError, ValueError):
+        return 0
+
+
+def _source_stamp(csv_file):
+    st = os.stat(csv_file)
+    return st.st_size, st.st_mtime_ns
+
+
+def _read_csv(csv_file):
+    paths, durations, last_used = [], [], []
+    with open(csv_file, encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            path = row.get('file_path')
+            if not path:
+                continue
+            paths.append(path)
+            durations.append(to_seconds(row.get('duration')))
+            last_used.append(to_seconds(row.get('lastest_used_value')))
+    return paths, np.array(durations, dtype=np.int64), np.array(last_used, dtype=np.int64)
+
+
+def migrate(csv_file, db_file=None):
+    """CSV -> SQLite (ghi vào file tạm rồi os.replace). return (durations, last_used, file_paths)"""
+    db_file = db_file or store_path(csv_file)
+    size, mtime_ns = _source_stamp(csv_file)
+    paths, durations, last_used = _read_csv(csv_file)
+
+    tmp = f"{db_file}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    with closing(sqlite3.connect(tmp)) as conn, conn:
+        conn.execute("CREATE TABLE meta (schema INTEGER, source TEXT, size INTEGER, mtime_ns INTEGER)")
+        conn.execute("INSERT INTO meta VALUES (?, ?, ?, ?)", (SCHEMA_VERSION, csv_file, size, mtime_ns))
+        conn.execute("CREATE TABLE clips (id INTEGER PRIMARY KEY, file_path TEXT, duration INTEGER, last_used INTEGER)")
+        conn.executemany(
+            "INSERT INTO clips (file_path, duration, last_used) VALUES (?, ?, ?)",
+            zip(paths, durations.tolist(), last_used.tolist())
+        )
+    try:
+        os.replace(tmp, db_file)
+    except OSError as e:  # tiến trình khác đang đọc (Windows), dùng dữ liệu vừa đọc, lần sau migrate lại
+        print(f"[CATALOG] Không thay được {db_file}: {e}")
+        os.remove(tmp)
+    return durations, last_used, paths
+
+
+def _is_current(conn, csv_file):
+    try:
+        meta = conn.execute("SELECT schema, size, mtime_ns FROM meta").fetchone()
+    except sqlite3.Error:
+        return False
+    return meta is not None and meta[0] == SCHEMA_VERSION and tuple(meta[1:]) == _source_stamp(csv_file)
+
+
+def load_arrays(csv_file):  # return (durations, last_used, file_paths); durations/last_used là mảng int64 (giây)
+    db_file = store_path(csv_file)
+    if os.path.exists(db_file):
+        with closing(sqlite3.connect(db_file)) as conn:
+            if _is_current(conn, csv_file):
+                rows = conn.execute("SELECT file_path, duration, last_used FROM clips ORDER BY id").fetchall()
+                if not rows:
+                    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), []
+                paths, durations, last_used = zip(*rows)
+                return np.array(durations, dtype=np.int64), np.array(last_used, dtype=np.int64), list(paths)
+    return migrate(csv_file, db_file)
+
+
+if __name__ == "__main__":
+    csv_files = sys.argv[1:] or sorted(glob.glob(os.path.join(REF_DIR, "*.csv")))
+    for csv_file in csv_files:
+        start = time.perf_counter()
+        durations, _, paths = migrate(csv_file)
+        print(f"{os.path.basename(csv_file):<28} {len(paths):6} clip  "
+              f"{int(durations.sum()) // 3600}h tổng  {time.perf_counter() - start:.2f}s -> {store_path(csv_file)}")
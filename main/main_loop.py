@@ -8,7 +8,10 @@ import smtplib
 import socket
 import traceback
 import sys
+import importlib
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from video_tools import NO_WORK_EXIT_CODE
 
 import locale
 locale.setlocale(locale.LC_ALL, '')
@@ -19,6 +22,23 @@ os.environ["PYTHONIOENCODING"] = "utf-8"
 
 SLEEP_SECONDS = 30
 
+# "parallel": chạy nhiều kênh cùng lúc, "sequential": lần lượt từng kênh như trước,
+# "daemon": như parallel nhưng import các kênh một lần và gọi main() ngay trong tiến trình này
+RUNNER_MODE = os.getenv("RUNNER_MODE", "parallel")
+# Số script kênh chạy cùng lúc (phần lớn là đọc/ghi Sheet, nhẹ)
+MAX_PARALLEL_TASKS = int(os.getenv("MAX_PARALLEL_TASKS", "6"))
+# Số job encode (nặng CPU/GPU) được chạy cùng lúc trên toàn máy, các script con dùng chung
+MAX_ENCODE_TASKS = int(os.getenv("MAX_ENCODE_TASKS", "2"))
+# CONCAT_NO_WORK_EXIT: script con thoát với NO_WORK_EXIT_CODE khi không có việc (runner cũ vẫn nhận 0)
+CHILD_ENV = {**os.environ, "CONCAT_NO_WORK_EXIT": "1"}
+if RUNNER_MODE != "sequential":  # chạy lần lượt thì chỉ có một job, không cần chia suất
+    CHILD_ENV["CONCAT_ENCODE_SLOTS"] = str(MAX_ENCODE_TASKS)
+
+# ===== Google Sheet: kiểm tra nhanh tab nào có việc trước khi chạy script =====
+CHECK_PENDING = os.getenv("CHECK_PENDING", "1") == "1"
+SHEET_NAME = 'Auto_concat_vids_ver2'
+CREDS_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\sheet.json"
+
 # ===== SMTP config (Gmail App Password hoặc SMTP khác) =====
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
@@ -32,14 +52,14 @@ MAX_BODY_CHARS = 15000  # giới hạn nội dung log/email
 # ===== Đảm bảo chạy các script từ cùng thư mục với auto_runner =====
 SCRIPT_DIR = Path(__file__).resolve().parent
 
-# Danh sách task: name, cmd, enabled
+# Danh sách task: name, cmd, enabled, sheet_index (tab trong SHEET_NAME mà script đọc)
 TASKS = [
-    {"name": "be_ca.py",         "cmd": [sys.executable, str(SCRIPT_DIR / "be_ca.py")],         "enabled": True},
-    {"name": "bluey.py",         "cmd": [sys.executable, str(SCRIPT_DIR / "bluey.py")],         "enabled": True},
-    {"name": "spidey.py",        "cmd": [sys.executable, str(SCRIPT_DIR / "spidey.py")],        "enabled": True},
-    {"name": "maycay.py",        "cmd": [sys.executable, str(SCRIPT_DIR / "maycay.py")],        "enabled": True},
-    {"name": "findtoys.py",      "cmd": [sys.executable, str(SCRIPT_DIR / "findtoys.py")],      "enabled": True},
-    {"name": "bluey_funtoys.py", "cmd": [sys.executable, str(SCRIPT_DIR / "bluey_funtoys.py")], "enabled": True},
+    {"name": "be_ca.py",         "cmd": [sys.executable, str(SCRIPT_DIR / "be_ca.py")],         "enabled": True, "sheet_index": 0},
+    {"name": "bluey.py",         "cmd": [sys.executable, str(SCRIPT_DIR / "bluey.py")],         "enabled": True, "sheet_index": 1},
+    {"name": "spidey.py",        "cmd": [sys.executable, str(SCRIPT_DIR / "spidey.py")],        "enabled": True, "sheet_index": 2},
+    {"name": "maycay.py",        "cmd": [sys.executable, str(SCRIPT_DIR / "maycay.py")],        "enabled": True, "sheet_index": 3},
+    {"name": "findtoys.py",      "cmd": [sys.executable, str(SCRIPT_DIR / "findtoys.py")],      "enabled": True, "sheet_index": 5},
+    {"name": "bluey_funtoys.py", "cmd": [sys.executable, str(SCRIPT_DIR / "bluey_funtoys.py")], "enabled": True, "sheet_index": 2},
 ]
 
 def send_error_email(task_name: str, err_summary: str, stdout_text: str, stderr_text: str):
@@ -87,6 +107,67 @@ Tóm tắt lỗi:
     except Exception as e:
         print(f"[ERROR] Gửi email thất bại: {e}")
 
+_sheet_state = {"spreadsheet": None, "status_ranges": {}}
+
+def _status_ranges(spreadsheet, indexes):
+    """Vùng A1 của cột 'status' (kể cả ô tiêu đề) trong từng tab, dò một lần rồi nhớ lại."""
+    ranges = _sheet_state["status_ranges"]
+    missing = [i for i in indexes if i not in ranges]
+    if missing:
+        worksheets = spreadsheet.worksheets()
+        titles = {i: worksheets[i].title.replace("'", "''") for i in missing}
+        headers = spreadsheet.values_batch_get([f"'{titles[i]}'!1:1" for i in missing])
+        for i, value_range in zip(missing, headers["valueRanges"]):
+            row = [str(c).strip().lower() for c in (value_range.get("values") or [[]])[0]]
+            if "status" not in row:
+                continue
+            col = row.index("status") + 1
+            letters = ""
+            while col:
+                col, rem = divmod(col - 1, 26)
+                letters = chr(65 + rem) + letters
+            ranges[i] = f"'{titles[i]}'!{letters}1:{letters}"
+    return ranges
+
+def pending_sheet_indexes():
+    """
+    Set index các tab có ít nhất một dòng status='auto', đọc bằng một lệnh
+    values_batch_get chỉ lấy cột status. None nếu không kiểm tra được
+    (khi đó runner chạy mọi task như cũ).
+    """
+    indexes = sorted({t["sheet_index"] for t in TASKS if t["enabled"] and "sheet_index" in t})
+    if not CHECK_PENDING or not indexes:
+        return None
+    try:
+        from sheet_client import get_client
+
+        if _sheet_state["spreadsheet"] is None:
+            _sheet_state["spreadsheet"] = get_client(CREDS_FILE).open(SHEET_NAME)
+        spreadsheet = _sheet_state["spreadsheet"]
+
+        ranges = _status_ranges(spreadsheet, indexes)
+        checked = [i for i in indexes if i in ranges]
+        result = spreadsheet.values_batch_get([ranges[i] for i in checked])
+
+        pending = set(i for i in indexes if i not in ranges)  # tab không có cột status: cứ chạy
+        for i, value_range in zip(checked, result["valueRanges"]):
+            values = [str(row[0]).strip().lower() if row else "" for row in value_range.get("values", [])]
+            if not values or values[0] != "status":
+                # cột đã bị đổi chỗ: dò lại lần sau, lần này cứ chạy
+                _sheet_state["status_ranges"].pop(i, None)
+                pending.add(i)
+            elif "auto" in values[1:]:
+                pending.add(i)
+        return pending
+    except Exception as e:
+        print(f"[WARN] Không kiểm tra được Google Sheet, chạy mọi task: {type(e).__name__}: {e}")
+        _sheet_state["spreadsheet"] = None
+        _sheet_state["status_ranges"].clear()
+        return None
+
+def has_pending(task, pending):
+    return pending is None or "sheet_index" not in task or task["sheet_index"] in pending
+
 def disable_task(task_name: str):
     for t in TASKS:
         if t["name"] == task_name:
@@ -94,7 +175,7 @@ def disable_task(task_name: str):
             return True
     return False
 
-def run_task_once(task):
+def run_task_once(task):  # return True nếu task đã xử lý được việc
     name = task["name"]
     cmd = task["cmd"]
     print(f"Running {name} ...")
@@ -104,7 +185,7 @@ def run_task_once(task):
         print(f"[ERROR] Không tìm thấy file: {cmd[-1]} → disable task {name}")
         send_error_email(name, "FileNotFound: script không tồn tại", "", "")
         disable_task(name)
-        return
+        return False
 
     try:
         completed = subprocess.run(
@@ -114,10 +195,14 @@ def run_task_once(task):
             capture_output=True,
             cwd=str(SCRIPT_DIR),  # đảm bảo cwd ổn định
             encoding="utf-8",
-            errors="replace"
+            errors="replace",
+            env=CHILD_ENV
         )
+        return True
 
     except subprocess.CalledProcessError as e:
+        if e.returncode == NO_WORK_EXIT_CODE:
+            return False
         err_summary = f"CalledProcessError: returncode={e.returncode}"
         print(f"[ERROR] {name} failed: {err_summary} → disable task {name}")
         send_error_email(name, err_summary, e.stdout or "", e.stderr or "")
@@ -129,17 +214,118 @@ def run_task_once(task):
         send_error_email(name, err_summary, "", traceback.format_exc())
         disable_task(name)
 
-def main_loop():
+    return False
+
+def load_channel_modules():
+    """Import script các kênh một lần cho daemon, đo và in thời gian khởi động."""
+    import video_tools
+    video_tools.ENCODE_SLOTS = MAX_ENCODE_TASKS
+
+    modules = {}
+    total_start = time.perf_counter()
+    for task in TASKS:
+        if not task["enabled"]:
+            continue
+        start = time.perf_counter()
+        try:
+            modules[task["name"]] = importlib.import_module(Path(task["name"]).stem)
+        except Exception as e:
+            err_summary = f"ImportError: {type(e).__name__}: {e}"
+            print(f"[ERROR] {task['name']}: {err_summary} → disable task {task['name']}")
+            send_error_email(task["name"], err_summary, "", traceback.format_exc())
+            disable_task(task["name"])
+            continue
+        print(f"[STARTUP] import {task['name']:<18} {time.perf_counter() - start:6.2f}s")
+
+    start = time.perf_counter()
+    try:
+        from sheet_client import get_client
+        get_client(CREDS_FILE)
+        print(f"[STARTUP] xác thực Google       {time.perf_counter() - start:6.2f}s")
+    except Exception as e:
+        print(f"[WARN] Chưa xác thực được Google: {e}")
+    print(f"[STARTUP] tổng                   {time.perf_counter() - total_start:6.2f}s "
+          f"(chế độ subprocess tốn khoảng chừng này cho mỗi lần chạy một kênh)")
+    return modules
+
+def make_inprocess_runner(modules):
+    def run_task_inprocess(task):  # return True nếu task đã xử lý được việc
+        name = task["name"]
+        print(f"Running {name} (in-process) ...")
+        try:
+            return bool(modules[name].main())
+        except Exception as e:
+            err_summary = f"Unexpected error: {type(e).__name__}: {e}"
+            print(f"[ERROR] {name} failed: {err_summary} → disable task {name}")
+            send_error_email(name, err_summary, "", traceback.format_exc())
+            disable_task(name)
+            return False
+    return run_task_inprocess
+
+def parallel_loop(run_task=run_task_once):
+    """
+    Chạy các task đang bật song song (tối đa MAX_PARALLEL_TASKS). Task vừa xử lý
+    được việc thì chạy lại ngay, chỉ nghỉ SLEEP_SECONDS khi task báo không có việc.
+    Hai task cùng sheet_index không bao giờ chạy cùng lúc: script nào cũng clear rồi
+    ghi lại cả tab, chạy chồng nhau thì bên xong sau xóa mất status 'Done' của bên kia.
+    """
+    next_run = {t["name"]: 0.0 for t in TASKS}
+    running = {}
+    pending, checked_at = None, None  # kết quả đọc Sheet gần nhất, dùng lại tối đa SLEEP_SECONDS
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_TASKS) as executor:
+        while True:
+            for name, future in list(running.items()):
+                if future.done():
+                    del running[name]
+                    did_work = future.result()
+                    next_run[name] = time.monotonic() + (0 if did_work else SLEEP_SECONDS)
+                    checked_at = None  # tab vừa được ghi lại, lần tới đọc Sheet mới
+
+            active = [t for t in TASKS if t["enabled"]]
+            if not active and not running:
+                print("[INFO] Không còn task nào đang bật. Dừng vòng lặp.")
+                break
+
+            now = time.monotonic()
+            busy_sheets = {t["sheet_index"] for t in TASKS if t["name"] in running and "sheet_index" in t}
+            # task chờ lâu nhất chạy trước, để task cùng tab không bị task luôn có việc chiếm mãi
+            due = sorted(
+                (t for t in active if t["name"] not in running and now >= next_run[t["name"]]),
+                key=lambda t: next_run[t["name"]]
+            )
+            ready = [t for t in due if t.get("sheet_index") not in busy_sheets]
+            # chỉ đọc Sheet khi còn suất chạy và có task chạy được ngay, không phải mỗi vòng 1s
+            if ready and len(running) < MAX_PARALLEL_TASKS:
+                if checked_at is None or now - checked_at >= SLEEP_SECONDS:
+                    # một lệnh đọc Sheet cho mọi task đến hạn, task không có dòng 'auto' thì không cần chạy
+                    pending, checked_at = pending_sheet_indexes(), now
+                for task in due:
+                    name = task["name"]
+                    if not has_pending(task, pending):
+                        next_run[name] = now + SLEEP_SECONDS
+                    elif len(running) < MAX_PARALLEL_TASKS and task.get("sheet_index") not in busy_sheets:
+                        running[name] = executor.submit(run_task, task)
+                        if "sheet_index" in task:
+                            busy_sheets.add(task["sheet_index"])
+
+            time.sleep(1)
+
+def sequential_loop():
     while True:
         active = [t for t in TASKS if t["enabled"]]
         if not active:
             print("[INFO] Không còn task nào đang bật. Dừng vòng lặp.")
             break
 
+        pending = pending_sheet_indexes()
+        ran = False
         for task in active:
-            if task["enabled"]:
+            if task["enabled"] and has_pending(task, pending):
                 run_task_once(task)
+                ran = True
                 time.sleep(SLEEP_SECONDS)
+        if not ran:
+            time.sleep(SLEEP_SECONDS)
 
 if __name__ == "__main__":
     try:
@@ -148,4 +334,9 @@ if __name__ == "__main__":
     except Exception:
         pass
 
-    main_loop()
+    if RUNNER_MODE == "sequential":
+        sequential_loop()
+    elif RUNNER_MODE == "daemon":
+        parallel_loop(make_inprocess_runner(load_channel_modules()))
+    else:
+        parallel_loop()
@@ -1,17 +1,12 @@
 import os
 import subprocess
 import json
-from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-from moviepy import VideoFileClip
+from sheet_client import get_client
 from datetime import datetime
-import warnings
-import shutil
-
-# Suppress moviepy subtitle warning
-warnings.filterwarnings("ignore", message="Subtitle stream parsing is not supported by moviepy")
+from video_tools import normalize_video, concat_video, auto_concat
+from video_probe import probe_duration, format_duration
+from catalog import append_rows_csv
 
 
 def check_and_add_next_spidey_videos(batch_size=5):
@@ -49,6 +44,7 @@ def check_and_add_next_spidey_videos(batch_size=5):
             return
 
     added_count = 0
+    new_rows = []
     all_files = []
     for root, _, files in os.walk(BASE_PATH):
         for item in files:
@@ -78,14 +74,12 @@ def check_and_add_next_spidey_videos(batch_size=5):
             continue
 
         # Lấy thời lượng video
-        try:
-            with VideoFileClip(matched_file) as video:
-                minute = int(round(video.duration)) // 60
-                sec = int(round(video.duration)) % 60
-                duration = f'{minute}:{sec:02d}'
-        except Exception as e:
-            print(f"[{next_number_str}] Lỗi đọc thời lượng video: {e}")
+        seconds = probe_duration(matched_file)
+        if seconds is None:
+            print(f"[{next_number_str}] Lỗi đọc thời lượng video")
             duration = "0:00"
+        else:
+            duration = format_duration(round(seconds))
 
         # Thời gian tạo
         try:
@@ -96,22 +90,16 @@ def check_and_add_next_spidey_videos(batch_size=5):
             print(f"[{next_number_str}] Lỗi lấy thời gian tạo file: {e}")
             creation_time = None
 
-        # Ghi vào CSV
+        # Gom lại, ghi CSV một lần ở cuối
+        new_rows.append([next_number, matched_file, duration, creation_time])
+        print(f"[{next_number_str}] Đã thêm: {matched_file}")
+
+    if new_rows:
         try:
-            columns = ['stt', 'file_path', 'duration', 'lastest_used_value']
-            new_row = pd.DataFrame([[next_number, matched_file, duration, creation_time]], columns=columns)
-            if os.path.exists(OUTPUT_FILE):
-                df = pd.read_csv(OUTPUT_FILE, encoding='utf-8-sig')
-                if set(columns).issubset(df.columns):
-                    df = df[columns]
-                df = pd.concat([df, new_row], ignore_index=True)
-            else:
-                df = new_row
-            df.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
-            added_count += 1
-            print(f"[{next_number_str}] Đã thêm: {matched_file}")
+            append_rows_csv(OUTPUT_FILE, new_rows)
+            added_count = len(new_rows)
         except Exception as e:
-            print(f"[{next_number_str}] Lỗi ghi vào CSV: {e}")
+            print(f"Lỗi ghi vào CSV: {e}")
 
     print(f"\nTổng cộng đã thêm {added_count} video vào '{OUTPUT_FILE}'.")
 
@@ -120,19 +108,10 @@ def check_and_add_next_spidey_videos(batch_size=5):
 
 
 def get_video_duration(file_path):
-    try:
-        result = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration", 
-             "-of", "default=noprint_wrappers=1:nokey=1", file_path],
-            capture_output=True, text=True
-        )
-        duration = float(result.stdout.strip())
-        minute = int(duration) // 60
-        sec = int(duration) % 60
-        return f"{minute}:{sec:02}"
-    except Exception as e:
-        print(f"Error getting duration for '{file_path}': {e}")
+    duration = probe_duration(file_path)
+    if duration is None:
         return "0:00"
+    return format_duration(duration)
 
 
 def get_list_video(ls, data_csv):  # return [(path, duration), ...]
@@ -163,107 +142,6 @@ def get_list_video(ls, data_csv):  # return [(path, duration), ...]
         return []
 
 
-def normalize_video(
-    input_path,
-    output_path,
-    width=1920,
-    height=1080,
-    fps=30,
-    use_nvenc=True,
-    cq=23,
-    v_bitrate="12M",
-    a_bitrate="160k",
-):
-     # Kiểm tra input/output có đúng định dạng string không
-    if not isinstance(input_path, str) or not isinstance(output_path, str):
-        raise TypeError(f"Đường dẫn input/output không hợp lệ: input={input_path}, output={output_path}")
-
-    if not shutil.which("ffmpeg"):
-        raise RuntimeError("ffmpeg không được tìm thấy trong PATH.")
-
-    if use_nvenc and shutil.which("nvidia-smi"):
-        vcodec = "h264_nvenc"
-        video_args = [
-            "-c:v", vcodec,
-            "-profile:v", "main",
-            "-rc", "cbr",
-            "-cq", str(cq),
-            "-b:v", v_bitrate,
-            "-maxrate", v_bitrate,
-            "-bufsize", str(int(int(v_bitrate[:-1]) * 2)) + "M" if v_bitrate.endswith("M") else "16M",
-            "-preset", "p4",
-        ]
-    else:
-        vcodec = "libx264"
-        video_args = [
-            "-c:v", vcodec,
-            "-preset", "medium",
-            "-profile:v", "main",
-            "-level", "4.2",
-            "-crf", str(cq if isinstance(cq, int) else 20),
-            "-maxrate", v_bitrate,
-            "-bufsize", "16M",
-        ]
-
-    command = [
-        "ffmpeg", "-y",
-        "-fflags", "+genpts",
-        "-i", input_path,
-        "-vf", f"scale={width}:{height}:flags=lanczos,fps={fps}",
-        *video_args,
-        "-pix_fmt", "yuv420p",
-        # "-vsync", "cfr",
-        "-fps_mode", "cfr",     
-        "-r", str(fps),         
-        "-movflags", "+faststart",
-        "-c:a", "aac",
-        "-ar", "48000",
-        "-b:a", a_bitrate,
-        output_path
-    ]
-
-    subprocess.run(command, check=True)
-
-
-
-def concat_video(video_paths, output_path):
-    list_file = "temp.txt"
-    with open(list_file, 'w', encoding='utf-8') as f:
-        for path in video_paths:
-            abs_path = os.path.abspath(path).replace("\\", "/")
-            f.write(f"file '{abs_path}'\n")
-
-    command = [
-        "ffmpeg", "-y",
-        "-f", "concat", "-safe", "0",
-        "-i", list_file,
-        "-c", "copy",
-        output_path
-    ]
-    subprocess.run(command, check=True)
-    os.remove(list_file)
-
-
-def auto_concat(input_videos, output_path):
-    normalized_paths = []
-
-    def normalize_and_collect(i, path):
-        fixed = f"normalized_{i}.mp4"
-        normalize_video(path, fixed)
-        return fixed
-
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        futures = [executor.submit(normalize_and_collect, i, path) for i, path in enumerate(input_videos)]
-        for future in futures:
-            normalized_paths.append(future.result())
-
-    concat_video(normalized_paths, output_path)
-
-    for path in normalized_paths:
-        os.remove(path)
-
-    print("Ghép video hoàn tất:", output_path)
-
 # debug
 def print_video_info(video_path):
     print(f"\nĐang kiểm tra: {video_path}")
@@ -300,14 +178,7 @@ def excel_to_sheet(excel_file, sheet_file, idx):
     df = pd.read_excel(excel_file, engine="openpyxl")
 
 
-    SCOPES = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive"
-    ]
-    CREDS_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\sheet.json"
-
-    creds = Credentials.from_service_account_file(CREDS_FILE, scopes=SCOPES)
-    gc = gspread.authorize(creds)
+    gc = get_client()
 
     spreadsheet = gc.open(sheet_file)
     worksheet = spreadsheet.get_worksheet(idx)  
@@ -0,0 +1,305 @@
+import os
+import struct
+import zlib
+from fractions import Fraction
+
+# Đọc thông tin stream của file MP4/MOV trực tiếp từ atom moov, không cần chạy ffprobe.
+# Chỉ đọc header các atom cấp 1 (vài lần đọc 16 byte) rồi đọc nguyên moov, kể cả khi moov nằm cuối file.
+# Trả về dict cùng dạng với video_probe.parse_probe, None nếu không đọc được (để quay về ffprobe).
+MAX_MOOV_BYTES = 64 * 1024 ** 2
+
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+CODEC_NAMES = {
+    b"avc1": "h264", b"avc3": "h264", b"hvc1": "hevc", b"hev1": "hevc", b"mp4v": "mpeg4",
+    b"av01": "av1", b"vp09": "vp9", b"ac-3": "ac3", b"ec-3": "eac3", b"Opus": "opus", b".mp3": "mp3",
+}
+AAC_OBJECT_TYPES = {0x40: "aac", 0x66: "aac", 0x67: "aac", 0x68: "aac", 0x69: "mp3", 0x6B: "mp3"}
+H264_PROFILES = {66: "Baseline", 77: "Main", 88: "Extended", 100: "High", 110: "High 10",
+                 122: "High 4:2:2", 244: "High 4:4:4 Predictive"}
+HEVC_PROFILES = {1: "Main", 2: "Main 10", 3: "Main Still Picture", 4: "Rext"}
+CHROMA_FORMATS = {0: "gray", 1: "yuv420p", 2: "yuv422p", 3: "yuv444p"}
+CHANNEL_LAYOUTS = {1: "mono", 2: "stereo", 6: "5.1"}
+AAC_SAMPLE_RATES = [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350]
+
+
+def _boxes(data, start=0, end=None):  # duyệt các box con trong một đoạn bytes: (type, payload_start, box_end)
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield box_type, pos + header, min(pos + size, end)
+        pos += size
+
+
+def read_moov(f):  # tìm atom moov ở cấp 1 bằng seek, return bytes hoặc None
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        head = f.read(16)
+        if len(head) < 8:
+            return None
+        size, box_type = struct.unpack_from(">I4s", head)
+        header = 8
+        if size == 1:
+            if len(head) < 16:
+                return None
+            size = struct.unpack_from(">Q", head, 8)[0]
+            header = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header:
+            return None
+        if box_type == b"moov":
+            if size > MAX_MOOV_BYTES:
+                return None
+            f.seek(pos + header)
+            data = f.read(size - header)
+            return data if len(data) == size - header else None
+        pos += size
+    return None
+
+
+def _full_box_version(data, start):
+    return data[start]
+
+
+def _parse_mdhd(data, start):  # return (timescale, duration)
+    if _full_box_version(data, start) == 1:
+        return struct.unpack_from(">IQ", data, start + 20)
+    return struct.unpack_from(">II", data, start + 12)
+
+
+def _parse_mvhd(data, start):
+    return _parse_mdhd(data, start)  # cùng bố cục timescale/duration
+
+
+def _parse_stts(data, start):  # return list (sample_count, sample_delta)
+    count = struct.unpack_from(">I", data, start + 4)[0]
+    return [struct.unpack_from(">II", data, start + 8 + i * 8) for i in range(count)]
+
+
+def _extradata_hash(data, start, end):  # cùng dạng extradata_hash của ffprobe -show_data_hash CRC32
+    return f"CRC32:{zlib.crc32(data[start:end]):08x}"
+
+
+def _parse_avcc(data, start, end, stream):
+    profile_idc, constraints = data[start + 1], data[start + 2]
+    stream["level"] = data[start + 3]
+    stream["extradata"] = _extradata_hash(data, start, end)
+    profile = H264_PROFILES.get(profile_idc)
+    if profile_idc == 66 and constraints & 0x40:
+        profile = "Constrained Baseline"
+    stream["profile"] = profile
+    stream["pix_fmt"] = "yuv420p"
+    if profile_idc in (100, 110, 122, 144, 244):
+        # phần mở rộng sau danh sách SPS/PPS chứa chroma_format và bit depth
+        pos = start + 6
+        for _ in range(data[start + 5] & 0x1F):
+            pos += 2 + struct.unpack_from(">H", data, pos)[0]
+        num_pps = data[pos]
+        pos += 1
+        for _ in range(num_pps):
+            pos += 2 + struct.unpack_from(">H", data, pos)[0]
+        if pos + 2 <= end:
+            stream["pix_fmt"] = _pix_fmt(data[pos] & 0x03, (data[pos + 1] & 0x07) + 8)
+
+
+def _parse_hvcc(data, start, end, stream):
+    stream["profile"] = HEVC_PROFILES.get(data[start + 1] & 0x1F)
+    stream["level"] = data[start + 12]  # general_level_idc
+    stream["extradata"] = _extradata_hash(data, start, end)
+    if start + 18 <= end:
+        stream["pix_fmt"] = _pix_fmt(data[start + 16] & 0x03, (data[start + 17] & 0x07) + 8)
+
+
+def _pix_fmt(chroma_format, bit_depth):
+    name = CHROMA_FORMATS.get(chroma_format)
+    if name and bit_depth > 8:
+        name += f"{bit_depth}le"
+    return name
+
+
+def _descriptor(data, pos):  # return (tag, payload_start, payload_end) của descriptor MPEG-4
+    tag = data[pos]
+    pos += 1
+    length = 0
+    for _ in range(4):
+        b = data[pos]
+        pos += 1
+        length = (length << 7) | (b & 0x7F)
+        if not b & 0x80:
+            break
+    return tag, pos, pos + length
+
+
+def _parse_esds(data, start, end, stream):
+    tag, pos, _ = _descriptor(data, start + 4)
+    if tag != 0x03:
+        return
+    flags = data[pos + 2]
+    pos += 3
+    if flags & 0x80:
+        pos += 2
+    if flags & 0x40:
+        pos += 1 + data[pos]
+    if flags & 0x20:
+        pos += 2
+    tag, pos, dc_end = _descriptor(data, pos)
+    if tag != 0x04:
+        return
+    stream["audio_codec"] = AAC_OBJECT_TYPES.get(data[pos], stream["audio_codec"])
+    pos += 13
+    if pos >= dc_end:
+        return
+    tag, pos, _ = _descriptor(data, pos)
+    if tag != 0x05 or stream["audio_codec"] != "aac":
+        return
+    # AudioSpecificConfig: object type (5 bit), sampling index (4 bit), channel config (4 bit)
+    bits = int.from_bytes(data[pos:pos + 5].ljust(5, b"\0"), "big")
+    index = (bits >> 31) & 0x0F
+    if index == 0x0F:
+        sample_rate = (bits >> 7) & 0xFFFFFF
+        channels = (bits >> 3) & 0x0F
+    else:
+        sample_rate = AAC_SAMPLE_RATES[index] if index < len(AAC_SAMPLE_RATES) else None
+        channels = (bits >> 27) & 0x0F
+    if sample_rate:
+        stream["sample_rate"] = sample_rate
+    if channels:
+        stream["channels"] = channels
+
+
+def _parse_video_entry(data, entry_type, start, end, stream):
+    stream["codec"] = CODEC_NAMES.get(entry_type, entry_type.decode("latin-1").strip())
+    stream["width"], stream["height"] = struct.unpack_from(">HH", data, start + 24)
+    for box_type, s, e in _boxes(data, start + 78, end):
+        if box_type == b"avcC":
+            _parse_avcc(data, s, e, stream)
+        elif box_type == b"hvcC":
+            _parse_hvcc(data, s, e, stream)
+        elif box_type == b"pasp":
+            h, v = struct.unpack_from(">II", data, s)
+            stream["sar"] = f"{h}:{v}"
+
+
+def _parse_audio_entry(data, entry_type, start, end, stream):
+    stream["audio_codec"] = CODEC_NAMES.get(entry_type, entry_type.decode("latin-1").strip())
+    version = struct.unpack_from(">H", data, start + 8)[0]
+    if version == 2:  # QuickTime sound description v2
+        stream["sample_rate"] = int(struct.unpack_from(">d", data, start + 32)[0])
+        stream["channels"] = struct.unpack_from(">I", data, start + 40)[0]
+        children = start + 64
+    else:
+        stream["channels"] = struct.unpack_from(">H", data, start + 16)[0]
+        stream["sample_rate"] = struct.unpack_from(">I", data, start + 24)[0] >> 16
+        children = start + (44 if version == 1 else 28)
+    for box_type, s, e in _boxes(data, children, end):
+        if box_type == b"esds":
+            _parse_esds(data, s, e, stream)
+        elif box_type == b"wave":  # QuickTime bọc esds trong wave
+            for inner_type, s2, e2 in _boxes(data, s, e):
+                if inner_type == b"esds":
+                    _parse_esds(data, s2, e2, stream)
+
+
+def _parse_trak(data, start, end):
+    stream = {"handler": None, "timescale": None, "duration": 0, "stts": [], "codec": None,
+              "profile": None, "level": None, "extradata": None, "width": None, "height": None, "pix_fmt": None, "sar": None,
+              "audio_codec": None, "sample_rate": None, "channels": None}
+    stsd = None
+    stack = [(start, end)]
+    while stack:
+        s, e = stack.pop()
+        for box_type, bs, be in _boxes(data, s, e):
+            if box_type in CONTAINERS:
+                stack.append((bs, be))
+            elif box_type == b"mdhd":
+                stream["timescale"], stream["duration"] = _parse_mdhd(data, bs)
+            elif box_type == b"hdlr" and data[bs + 4:bs + 8] != b"dhlr":  # MOV có thêm hdlr dữ liệu trong minf
+                stream["handler"] = data[bs + 8:bs + 12]
+            elif box_type == b"stts":
+                stream["stts"] = _parse_stts(data, bs)
+            elif box_type == b"stsd":
+                stsd = (bs, be)
+    if stsd:
+        for entry_type, s, e in _boxes(data, stsd[0] + 8, stsd[1]):
+            if stream["handler"] == b"vide":
+                _parse_video_entry(data, entry_type, s, e, stream)
+            elif stream["handler"] == b"soun":
+                _parse_audio_entry(data, entry_type, s, e, stream)
+            break  # chỉ lấy sample entry đầu tiên
+    return stream
+
+
+def _frame_rates(stream):  # return (r_frame_rate, avg_frame_rate) dạng "num/den" như ffprobe
+    timescale, stts = stream["timescale"], stream["stts"]
+    if not timescale or not stts:
+        return None, None
+    frames = sum(count for count, _ in stts)
+    common_delta = max(stts, key=lambda entry: entry[0])[1]
+    rate = Fraction(timescale, common_delta) if common_delta else None
+    avg = Fraction(frames * timescale, stream["duration"]) if stream["duration"] else rate
+    to_str = lambda r: f"{r.numerator}/{r.denominator}" if r else None
+    return to_str(rate), to_str(avg)
+
+
+def parse_moov(data):
+    result = {
+        "duration": 0.0,
+        "video_codec": None, "profile": None, "level": None, "extradata": None, "width": None, "height": None,
+        "fps": None, "avg_fps": None, "pix_fmt": None, "sar": None, "time_base": None,
+        "audio_codec": None, "sample_rate": None, "channels": None, "channel_layout": None,
+    }
+    track_durations = []
+    for box_type, s, e in _boxes(data):
+        if box_type == b"mvhd":
+            timescale, duration = _parse_mvhd(data, s)
+            if timescale:
+                result["duration"] = duration / timescale
+        elif box_type == b"trak":
+            stream = _parse_trak(data, s, e)
+            if stream["timescale"]:
+                track_durations.append(stream["duration"] / stream["timescale"])
+            if stream["handler"] == b"vide" and result["video_codec"] is None:
+                fps, avg_fps = _frame_rates(stream)
+                result.update({
+                    "video_codec": stream["codec"], "profile": stream["profile"],
+                    "level": stream["level"], "extradata": stream["extradata"],
+                    "width": stream["width"], "height": stream["height"],
+                    "fps": fps, "avg_fps": avg_fps, "pix_fmt": stream["pix_fmt"], "sar": stream["sar"],
+                    "time_base": f"1/{stream['timescale']}" if stream["timescale"] else None,
+                })
+            elif stream["handler"] == b"soun" and result["audio_codec"] is None:
+                result.update({
+                    "audio_codec": stream["audio_codec"], "sample_rate": stream["sample_rate"],
+                    "channels": stream["channels"], "channel_layout": CHANNEL_LAYOUTS.get(stream["channels"]),
+                })
+    if not result["duration"] and track_durations:
+        result["duration"] = max(track_durations)
+    return result
+
+
+def read_info(file_path):  # return dict thông tin stream, None nếu không đọc được
+    try:
+        with open(file_path, "rb") as f:
+            data = read_moov(f)
+        if data is None:
+            return None
+        info = parse_moov(data)
+    except (OSError, struct.error, IndexError, ValueError, ZeroDivisionError):
+        return None
+    # file phân mảnh (moof) hoặc thiếu track video: để ffprobe xử lý
+    if not info["duration"] or info["video_codec"] is None:
+        return None
+    return info
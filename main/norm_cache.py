@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# Cache các clip đã normalize, dùng lại giữa các lần ghép.
+# Key = (đường dẫn nguồn, size, mtime, tham số normalize); dọn theo LRU khi vượt dung lượng.
+CACHE_DIR = os.getenv("CONCAT_CACHE_DIR", r"C:\Users\Admin\Documents\concatenate videos\cache\normalized")
+CACHE_MAX_BYTES = int(float(os.getenv("CONCAT_CACHE_MAX_GB", "200")) * 1024 ** 3)
+PART_SUFFIX = ".part.mp4"
+# File vừa lookup()/store() trong khoảng này có thể đang chờ concat ở job của tiến trình khác, không evict
+EVICT_MIN_AGE_SECONDS = int(float(os.getenv("CONCAT_CACHE_MIN_AGE_HOURS", "6")) * 3600)
+
+_evict_lock = threading.Lock()
+
+
+def cache_key(source_path, params):
+    st = os.stat(source_path)
+    payload = json.dumps(
+        [os.path.abspath(source_path), st.st_size, st.st_mtime_ns, params],
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def lookup(source_path, params):  # return path trong cache hoặc None
+    cached = os.path.join(CACHE_DIR, cache_key(source_path, params) + ".mp4")
+    if not os.path.exists(cached):
+        return None
+    try:
+        os.utime(cached)  # đánh dấu vừa dùng cho LRU
+    except OSError:
+        pass
+    return cached
+
+
+def temp_path(source_path, params):  # file tạm để normalize vào, store() sẽ đổi tên
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    key = cache_key(source_path, params)
+    return os.path.join(CACHE_DIR, f"{key}.{os.getpid()}.{threading.get_ident()}{PART_SUFFIX}")
+
+
+def store(source_path, params, produced_path, keep=()):
+    cached = os.path.join(CACHE_DIR, cache_key(source_path, params) + ".mp4")
+    os.replace(produced_path, cached)
+    evict(keep=keep, protect=cached)
+    return cached
+
+
+def evict(max_bytes=CACHE_MAX_BYTES, keep=(), protect=None):
+    """
+    Xóa các file ít dùng nhất cho tới khi tổng dung lượng cache <= max_bytes.
+    keep chỉ bảo vệ file của job hiện tại; file của job khác được giữ nhờ mtime còn mới
+    (lookup() chạm vào file trước khi trả về).
+    """
+    with _evict_lock:
+        try:
+            entries = [
+                e for e in os.scandir(CACHE_DIR)
+                if e.is_file() and e.name.endswith(".mp4") and not e.name.endswith(PART_SUFFIX)
+            ]
+        except FileNotFoundError:
+            return
+        stats = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in entries]
+        total = sum(size for _, size, _ in stats)
+        recent = time.time() - EVICT_MIN_AGE_SECONDS
+        for mtime, size, path in sorted(stats):
+            if total <= max_bytes or mtime >= recent:
+                break  # sắp theo mtime: từ đây trở đi đều là file mới dùng
+            if path == protect or path in keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass  # đang được job khác đọc
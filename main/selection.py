@@ -0,0 +1,115 @@
+import os
+import numpy as np
+
+# Chọn clip ghép bằng NumPy thay cho vòng random.choice + list.remove (O(n) mỗi lần remove).
+# plan_rows lập playlist cho mọi dòng một lần chạy: "random" cắt một hoán vị ngẫu nhiên thành các đoạn
+# vừa đủ thời lượng (cùng phân phối với vòng lặp cũ), "pack" giải subset-sum cho sát thời lượng cần.
+PACK_TOLERANCE_SECONDS = int(os.getenv("CONCAT_PACK_TOLERANCE", "10"))  # chế độ "pack": chấp nhận dư tối đa bao nhiêu giây
+# Trọng số "fresh": clip càng lâu chưa dùng (lastest_used_value lớn) và càng ít lần dùng thì càng dễ được chọn
+FRESHNESS_AGE_POWER = float(os.getenv("CONCAT_FRESHNESS_AGE_POWER", "0.5"))
+FRESHNESS_USE_POWER = float(os.getenv("CONCAT_FRESHNESS_USE_POWER", "1.0"))
+
+
+def eligible_indexes(file_paths, used_paths):  # index các clip chưa dùng
+    return np.fromiter((i for i, p in enumerate(file_paths) if p not in used_paths), dtype=np.int64)
+
+
+def freshness_weights(last_used, use_counts=None):
+    """lastest_used_value (giây) + số lần đã dùng -> trọng số chọn (mảng cùng độ dài catalog)."""
+    age_days = np.maximum(np.asarray(last_used, dtype=float), 0) / 86400
+    weights = (1 + age_days) ** FRESHNESS_AGE_POWER
+    if use_counts is not None:
+        weights = weights / (1 + np.asarray(use_counts, dtype=float)) ** FRESHNESS_USE_POWER
+    return weights
+
+
+def random_order(candidates, rng, weights=None):
+    """
+    Thứ tự bốc ngẫu nhiên không lặp. Có weights thì dùng khóa Efraimidis–Spirakis (-log(u)/w, nhỏ trước),
+    tương đương bốc lần lượt theo trọng số mà không cần vòng lặp Python.
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+    keys = rng.random(len(candidates))
+    if weights is not None:
+        keys = -np.log1p(-keys) / np.maximum(weights[candidates], 1e-12)
+    return candidates[np.argsort(keys)]
+
+
+def pack_clips(durations, candidates, target, tolerance=PACK_TOLERANCE_SECONDS, rng=None, weights=None):
+    """
+    Subset-sum ngẫu nhiên: chọn tập clip có tổng >= target và dư ít nhất, thay vì dư tới gần một clip.
+    DP bitset bằng số nguyên Python (bit s bật = có tập con tổng s giây), duyệt clip theo thứ tự ngẫu nhiên
+    (có weights thì theo trọng số) và dừng ngay khi đạt được tổng trong [target, target + tolerance].
+    """
+    rng = rng or np.random.default_rng()
+    target = int(np.ceil(target))
+    if target <= 0 or len(candidates) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = random_order(candidates, rng, weights=weights)
+    order = order[durations[order] > 0]
+    lengths = durations[order].astype(np.int64).tolist()
+    # tập tối thiểu đạt target luôn có tổng < target + clip dài nhất, không cần giữ các bit cao hơn
+    mask = (1 << (target + max(lengths, default=0) + 1)) - 1
+    window = ((1 << (tolerance + 1)) - 1) << target
+    reach = 1
+    states = [reach]
+    for d in lengths:
+        reach = (reach | (reach << d)) & mask
+        states.append(reach)
+        if reach & window:
+            break
+    above = reach >> target
+    if not above:
+        return order  # cả catalog cộng lại vẫn chưa đủ
+    best = target + (above & -above).bit_length() - 1
+
+    chosen = []
+    for k in range(len(states) - 1, 0, -1):  # truy vết: clip k có dùng nếu tổng best chưa đạt được trước nó
+        if not (states[k - 1] >> best) & 1:
+            chosen.append(order[k - 1])
+            best -= lengths[k - 1]
+    return np.array(chosen[::-1], dtype=np.int64)
+
+
+def plan_rows(durations, candidates, targets, mode="random", rng=None, weights=None):
+    """
+    Lập playlist cho mọi dòng của một lần chạy cùng lúc, không dòng nào dùng lại clip của dòng khác.
+    random: một thứ tự bốc (có trọng số) cho cả batch, cắt thành các đoạn liên tiếp bằng cumsum + searchsorted.
+    pack: giải subset-sum lần lượt từng dòng trên phần clip còn lại.
+    Hết clip giữa chừng thì phần còn lại bốc lại từ toàn bộ candidates (như reset log).
+    """
+    if mode not in ("random", "pack"):
+        raise ValueError(f"Unknown selection mode: {mode}")
+    rng = rng or np.random.default_rng()
+    candidates = np.asarray(candidates, dtype=np.int64)
+    picks = []
+    if mode == "pack":
+        remaining = candidates
+        for target in targets:
+            if durations[remaining].sum() < target:
+                print("Không đủ clip chưa dùng cho mọi dòng, bốc lại từ đầu.")
+                remaining = candidates
+            chosen = pack_clips(durations, remaining, target, rng=rng, weights=weights)
+            remaining = remaining[~np.isin(remaining, chosen)]
+            picks.append(chosen)
+        return picks
+
+    order = random_order(candidates, rng, weights=weights)
+    cumulative = np.cumsum(durations[order])
+    start = 0
+    for target in targets:
+        if target <= 0 or len(order) == 0:
+            picks.append(np.zeros(0, dtype=np.int64))
+            continue
+        base = cumulative[start - 1] if start else 0
+        end = int(np.searchsorted(cumulative, base + target, side='left')) + 1
+        if end > len(order) and start:
+            print("Không đủ clip chưa dùng cho mọi dòng, bốc lại từ đầu.")
+            order = random_order(candidates, rng, weights=weights)
+            cumulative = np.cumsum(durations[order])
+            start = 0
+            end = int(np.searchsorted(cumulative, target, side='left')) + 1
+        end = min(end, len(order))
+        picks.append(order[start:end])
+        start = end
+    return picks
@@ -0,0 +1,24 @@
+import threading
+import gspread
+from google.oauth2.service_account import Credentials
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+CREDS_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\sheet.json"
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(creds_file=CREDS_FILE):
+    """
+    gspread client dùng chung trong cả tiến trình: chỉ xác thực một lần,
+    token được gspread tự làm mới khi hết hạn (quan trọng khi chạy daemon).
+    """
+    with _lock:
+        if creds_file not in _clients:
+            creds = Credentials.from_service_account_file(creds_file, scopes=SCOPES)
+            _clients[creds_file] = gspread.authorize(creds)
+        return _clients[creds_file]
@@ -1,13 +1,13 @@
 import os
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
+from sheet_client import get_client
 from gspread_dataframe import set_with_dataframe
 from module3 import *
+from video_tools import exit_code
 import sys
 sys.stdout.reconfigure(encoding='utf-8')
 
-EXCEL_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\temp.xlsx"
+EXCEL_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\temp_spidey.xlsx"  # riêng từng kênh để chạy song song
 CSV_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\spidey_data.csv"
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
@@ -16,6 +16,7 @@ SCOPES = [
 CREDS_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\sheet.json"
 SHEET_NAME = 'Auto_concat_vids_ver2'
 OUTPUT_DIR = r"\\n8n\D\output_spidey"
+CONCAT_ENGINE = "two_stage"  # "two_stage", "filter_complex" hoặc "pipeline"
 
 
 def clear_excel_file(excel_file):
@@ -75,8 +76,7 @@ def main(worksheet_idx=2):
         return
 
     try:
-        creds = Credentials.from_service_account_file(CREDS_FILE, scopes=SCOPES)
-        gc = gspread.authorize(creds)
+        gc = get_client(CREDS_FILE)
         copy_from_ggsheet_to_excel(gc, SHEET_NAME, EXCEL_FILE, worksheet_idx)
     except Exception as e:
         print(f"Lỗi xác thực Google hoặc tải sheet: {e}")
@@ -128,7 +128,7 @@ def main(worksheet_idx=2):
 
     for job in jobs:
         print(f"Concatenating {len(job['selected_files'])} video(s) -> {job['output_path']}")
-        ok = auto_concat(job['selected_files'], job['output_path'])
+        ok = auto_concat(job['selected_files'], job['output_path'], engine=CONCAT_ENGINE)
         row_index = job['group_index']
         current_value = original_df.at[row_index, 'output directory']
         new_val = job['output_path'] if pd.isna(current_value) or str(current_value).strip().lower() in ('nan', '') else f"{current_value}\n{job['output_path']}"
@@ -142,7 +142,10 @@ def main(worksheet_idx=2):
         print("Đã cập nhật Google Sheet.")
     except Exception as e:
         print(f"Lỗi khi lưu hoặc cập nhật Google Sheet: {e}")
+        # status trên Sheet vẫn là 'auto': báo lỗi để runner dừng task, không encode lại các dòng này mãi
+        raise RuntimeError(f"Không cập nhật được Google Sheet: {e}") from e
+    return len(jobs)
 
 if __name__ == '__main__':
 
-    main()
\ No newline at end of file
+    sys.exit(exit_code(main()))
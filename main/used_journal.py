@@ -0,0 +1,133 @@
+import os
+import time
+
+# Nhật ký video đã dùng, chỉ ghi nối: mỗi dòng "ts<TAB>path[<TAB>số lần]", dòng "ts<TAB>#RESET" đánh dấu reset log.
+# Dòng cũ chỉ có path (log_file/*.log trước đây) vẫn đọc được, coi như ts = 0.
+# Ghi thêm tốn O(số dòng mới) + fsync; khi file phình to thì gộp lại (ghi file tạm rồi os.replace).
+RESET_MARKER = "#RESET"
+COMPACT_MIN_LINES = int(os.getenv("USED_JOURNAL_COMPACT_LINES", "5000"))
+
+
+def _parse(line):  # return (ts, path, count) hoặc None
+    parts = line.rstrip("\r\n").split("\t")
+    if not parts[0]:
+        return None
+    if len(parts) == 1:
+        return 0.0, parts[0], 1  # dòng cũ: chỉ có path
+    try:
+        ts = float(parts[0])
+        count = int(parts[2]) if len(parts) > 2 else 1
+    except ValueError:
+        return None
+    return ts, parts[1], count
+
+
+class UsedJournal:
+    def __init__(self, path):
+        self.path = path
+        self.lines = 0
+        self.entries = 0   # số path khác nhau sau khi gộp
+
+    def read(self):
+        """return list các đoạn giữa các mốc reset: (ts reset, {path: [ts cuối, số lần]}), đoạn đầu có ts reset None"""
+        segments = [(None, {})]
+        self.lines = 0
+        if not os.path.exists(self.path):
+            return segments
+        with open(self.path, encoding="utf-8") as f:
+            data = f.read()
+        lines = data.split("\n")
+        if not data.endswith("\n"):
+            lines = lines[:-1]  # dòng cuối ghi dở (mất điện / crash), bỏ qua
+        for line in lines:
+            entry = _parse(line)
+            if entry is None:
+                continue
+            self.lines += 1
+            ts, path, count = entry
+            if path == RESET_MARKER:
+                segments.append((ts, {}))
+                continue
+            current = segments[-1][1].setdefault(path, [0.0, 0])
+            current[0] = max(current[0], ts)
+            current[1] += count
+        # kích thước sau khi gộp: lịch sử trước reset cuối + một mốc reset + đoạn hiện tại
+        history = set().union(*(segment for _, segment in segments[:-1]))
+        self.entries = len(history) + (len(segments) > 1) + len(segments[-1][1])
+        return segments
+
+    def load(self):  # return (set path đang tính là đã dùng, {path: tổng số lần dùng})
+        segments = self.read()
+        counts = {}
+        for _, segment in segments:
+            for path, (_, count) in segment.items():
+                counts[path] = counts.get(path, 0) + count
+        return set(segments[-1][1]), counts
+
+    def _drop_torn_tail(self):  # cắt dòng ghi dở của lần trước (crash giữa chừng) trước khi ghi nối
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(0, end - 4096)
+                f.seek(start)
+                chunk = f.read(end - start)
+                cut = chunk.rfind(b"\n")
+                if cut >= 0:
+                    end = start + cut + 1
+                    break
+                end = start
+            if end < size:
+                f.truncate(end)
+
+    def _append_lines(self, lines):
+        self._drop_torn_tail()
+        with open(self.path, "a", encoding="utf-8", newline="\n") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.lines += len(lines)
+
+    def append(self, paths, ts=None):
+        ts = time.time() if ts is None else ts
+        lines = [f"{ts:.0f}\t{path}\n" for path in sorted(paths)]
+        if lines:
+            self._append_lines(lines)
+        if self.lines > max(COMPACT_MIN_LINES, 2 * self.entries):
+            self.compact()
+
+    def reset(self, ts=None):
+        ts = time.time() if ts is None else ts
+        self._append_lines([f"{ts:.0f}\t{RESET_MARKER}\n"])
+
+    def compact(self):
+        """
+        Gộp các đoạn trước mốc reset cuối thành một khối (mỗi path một dòng kèm tổng số lần dùng),
+        giữ đoạn hiện tại làm tập đã dùng. Ghi an toàn qua file tạm rồi os.replace.
+        """
+        segments = self.read()
+        history = {}
+        for _, segment in segments[:-1]:
+            for path, (ts, count) in segment.items():
+                current = history.setdefault(path, [0.0, 0])
+                current[0] = max(current[0], ts)
+                current[1] += count
+        reset_ts, segment = segments[-1]
+        blocks = [history, segment] if reset_ts is not None else [segment]
+
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        lines = 0
+        with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+            for k, block in enumerate(blocks):
+                if k:
+                    f.write(f"{reset_ts:.0f}\t{RESET_MARKER}\n")
+                    lines += 1
+                for path, (ts, count) in sorted(block.items()):
+                    f.write(f"{ts:.0f}\t{path}\t{count}\n")
+                    lines += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.lines = self.entries = lines
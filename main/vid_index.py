@@ -0,0 +1,172 @@
+import os
+import re
+import json
+import time
+import threading
+from video_probe import PROBE_WORKERS, iter_durations, format_duration
+
+# Chỉ mục tên file trong thư mục gốc của từng kênh trên NAS, lưu ra đĩa giữa các lần chạy.
+# Mỗi thư mục lưu kèm mtime: refresh() chỉ liệt kê lại thư mục có mtime thay đổi (thêm/xóa/đổi tên bên trong),
+# thư mục không đổi chỉ tốn một lần stat. Tra số video đầu -> path là tra dict.
+# Thời lượng không lưu ở đây mà lấy từ cache probe SQLite chung (video_probe.probe_cached).
+INDEX_DIR = os.getenv("CONCAT_INDEX_DIR", r"C:\Users\Admin\Documents\concatenate videos\cache\index")
+REFRESH_SECONDS = float(os.getenv("CONCAT_INDEX_REFRESH_SECONDS", "300"))
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.flv')
+
+
+def is_video(name):
+    return name.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def numbered_file_keys(suffix):
+    """
+    Kiểu Bé Cá / Bluey: video đầu số n là file chứa '{n} {suffix}.mp4'.
+    Ưu tiên 0: nằm trong thư mục '{n} {suffix}'; ưu tiên 1: nằm ở bất kỳ đâu trong thư mục gốc.
+    """
+    file_pattern = re.compile(rf'(\d+) {re.escape(suffix.lower())}\.mp4')
+    folder_pattern = re.compile(rf'(\d+) {re.escape(suffix)}', re.IGNORECASE)
+
+    def keys(top, filename):
+        result = []
+        for m in file_pattern.finditer(filename.lower()):
+            digits = m.group(1)
+            # giữ đúng kiểu so khớp chuỗi con cũ: '59 kb.mp4' cũng nằm trong '159 kb.mp4'
+            for i in range(len(digits)):
+                n = digits[i:]
+                folder = folder_pattern.fullmatch(top)
+                result.append((n, 0 if folder and folder.group(1) == n else 1))
+        return result
+    return keys
+
+
+def numbered_folder_keys(top, filename):
+    # Kiểu máy cày / findtoys / funtoys: video đầu số n là video đầu tiên trong thư mục cấp 1 có số n trong tên
+    return [(n, 0) for n in re.findall(r'\d+', top)]
+
+
+class FolderIndex:
+    def __init__(self, name, base_folder, key_func, max_priority=0):
+        self.name = name
+        self.base_folder = base_folder
+        self.key_func = key_func          # (thư mục cấp 1, tên file) -> [(số, ưu tiên)]
+        self.max_priority = max_priority  # bỏ qua kết quả có ưu tiên lớn hơn
+        self.index_file = os.path.join(INDEX_DIR, f"{name}.json")
+        self.dirs = None       # rel_dir -> {"mtime": ns, "dirs": [...], "files": [...]}
+        self.by_number = {}    # số -> path
+        self.refreshed_at = 0
+        self._lock = threading.RLock()
+
+    def _load(self):
+        try:
+            with open(self.index_file, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("base_folder") == self.base_folder:
+                self.dirs = data.get("dirs", {})
+        except (OSError, ValueError):
+            pass
+        if self.dirs is None:
+            self.dirs = {}
+        self._build_numbers()
+
+    def save(self):
+        with self._lock:
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            tmp = f"{self.index_file}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"base_folder": self.base_folder, "dirs": self.dirs}, f, ensure_ascii=False)
+            os.replace(tmp, self.index_file)
+
+    def _scan(self, rel, out):
+        full = os.path.join(self.base_folder, rel) if rel else self.base_folder
+        try:
+            mtime = os.stat(full).st_mtime_ns
+        except OSError:
+            if not rel:
+                raise  # thư mục gốc không truy cập được (NAS chưa mount...)
+            return False  # thư mục con bị xóa / không có quyền (#recycle, @eaDir...): bỏ qua như os.walk
+        entry = self.dirs.get(rel)
+        changed = False
+        if entry is None or entry["mtime"] != mtime:
+            subdirs, files = [], []
+            try:
+                with os.scandir(full) as it:
+                    for e in it:
+                        if e.is_dir():
+                            subdirs.append(e.name)
+                        elif is_video(e.name):
+                            files.append(e.name)
+            except OSError:
+                if not rel:
+                    raise
+                return False
+            entry = {"mtime": mtime, "dirs": subdirs, "files": files}
+            changed = True
+        out[rel] = entry
+        for d in entry["dirs"]:
+            changed |= self._scan(os.path.join(rel, d) if rel else d, out)
+        return changed
+
+    def refresh(self):
+        with self._lock:
+            if self.dirs is None:
+                self._load()
+            start = time.perf_counter()
+            scanned = {}
+            changed = self._scan("", scanned)
+            changed |= scanned.keys() != self.dirs.keys()
+            self.dirs = scanned
+            self.refreshed_at = time.time()
+            if changed:
+                self._build_numbers()
+                self.save()
+            print(f"[INDEX] {self.name}: {len(scanned)} thư mục, {time.perf_counter() - start:.1f}s"
+                  f"{' (có thay đổi)' if changed else ''}")
+
+    def _walk(self, rel=""):  # cùng thứ tự với os.walk top-down
+        entry = self.dirs.get(rel)
+        if entry is None:
+            return
+        yield rel, entry["files"]
+        for d in entry["dirs"]:
+            yield from self._walk(os.path.join(rel, d) if rel else d)
+
+    def _build_numbers(self):
+        best = {}
+        for rel, files in self._walk():
+            top = rel.split(os.sep)[0] if rel else ""
+            for file in files:
+                for n, priority in self.key_func(top, file):
+                    if priority > self.max_priority:
+                        continue
+                    if n not in best or priority < best[n][0]:
+                        best[n] = (priority, os.path.join(self.base_folder, rel, file))
+        self.by_number = {n: path for n, (_, path) in best.items()}
+
+    def _ensure_fresh(self):
+        if self.dirs is None or time.time() - self.refreshed_at > REFRESH_SECONDS:
+            self.refresh()
+
+    def find_many(self, numbers):  # return {số: path hoặc None}, chỉ refresh tối đa một lần
+        keys = {n: str(n).strip() for n in numbers}
+        with self._lock:
+            self._ensure_fresh()
+            missing = any(k not in self.by_number for k in keys.values())
+            if missing and time.time() - self.refreshed_at > 1:
+                self.refresh()  # có thể vừa upload thêm thư mục mới
+            return {n: self.by_number.get(k) for n, k in keys.items()}
+
+    def find(self, number):  # return path hoặc None
+        return self.find_many([number])[number]
+
+    def lookup(self, number):  # return (path, "m:ss") hoặc (None, 0)
+        return self.lookup_many([number])[number]
+
+    def lookup_many(self, numbers, max_workers=PROBE_WORKERS):
+        """Tra nhiều số trong một lần quét; các file tìm được probe song song. return {số: (path, "m:ss")}"""
+        paths = self.find_many(numbers)
+        found = sorted({p for p in paths.values() if p})
+        durations = {}
+        if found:
+            for path, seconds in iter_durations(found, min(max_workers, len(found))):
+                durations[path] = format_duration(seconds) if seconds is not None else "0:00"
+        return {n: (p, durations[p]) if p else (None, 0) for n, p in paths.items()}
@@ -0,0 +1,172 @@
+import os
+import json
+import sqlite3
+import time
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+import mp4_header
+
+# Cache kết quả ffprobe trên đĩa (SQLite), key = (path, size, mtime): mỗi file trên NAS chỉ probe lại khi thay đổi.
+PROBE_DB = os.getenv("CONCAT_PROBE_DB", r"C:\Users\Admin\Documents\concatenate videos\cache\probe.sqlite")
+PROBE_TIMEOUT = float(os.getenv("CONCAT_PROBE_TIMEOUT", "120"))
+PROBE_WORKERS = int(os.getenv("CONCAT_PROBE_WORKERS", "8"))  # probe qua SMB chờ mạng là chính, không tốn CPU
+# MP4/MOV đọc thẳng atom moov bằng mp4_header, không tốn một tiến trình ffprobe mỗi file
+HEADER_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+USE_HEADER_PARSER = os.getenv("CONCAT_HEADER_PARSER", "1") == "1"
+
+_local = threading.local()  # mỗi thread một connection
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_probe(info):  # ffprobe json -> dict phẳng
+    fmt = info.get("format", {})
+    result = {
+        "duration": float(fmt.get("duration") or 0),
+        "video_codec": None, "profile": None, "level": None, "extradata": None, "width": None, "height": None,
+        "fps": None, "avg_fps": None, "pix_fmt": None, "sar": None, "time_base": None,
+        "audio_codec": None, "sample_rate": None, "channels": None, "channel_layout": None,
+    }
+    for stream in info.get("streams", []):
+        if stream.get("codec_type") == "video" and result["video_codec"] is None:
+            result.update({
+                "video_codec": stream.get("codec_name"),
+                "profile": stream.get("profile"),
+                "level": _to_int(stream.get("level")),
+                "extradata": stream.get("extradata_hash"),  # cần -show_data_hash
+                "width": _to_int(stream.get("width")),
+                "height": _to_int(stream.get("height")),
+                "fps": stream.get("r_frame_rate"),
+                "avg_fps": stream.get("avg_frame_rate"),
+                "pix_fmt": stream.get("pix_fmt"),
+                "sar": stream.get("sample_aspect_ratio"),
+                "time_base": stream.get("time_base"),
+            })
+        elif stream.get("codec_type") == "audio" and result["audio_codec"] is None:
+            result.update({
+                "audio_codec": stream.get("codec_name"),
+                "sample_rate": _to_int(stream.get("sample_rate")),
+                "channels": _to_int(stream.get("channels")),
+                "channel_layout": stream.get("channel_layout"),
+            })
+    return result
+
+
+def ffprobe_video(file_path):  # return dict thông tin stream, None nếu lỗi
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-print_format", "json", "-show_data_hash", "CRC32",
+             "-show_streams", "-show_format", file_path],
+            capture_output=True, text=True, check=True, timeout=PROBE_TIMEOUT
+        )
+        return parse_probe(json.loads(result.stdout))
+    except Exception as e:
+        print(f"Error probing '{file_path}': {e}")
+        return None
+
+
+def probe_video(file_path):  # header MP4/MOV nếu đọc được, còn lại dùng ffprobe
+    if USE_HEADER_PARSER and file_path.lower().endswith(HEADER_EXTENSIONS):
+        info = mp4_header.read_info(file_path)
+        if info is not None:
+            return info
+    return ffprobe_video(file_path)
+
+
+def _db():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(PROBE_DB), exist_ok=True)
+        conn = sqlite3.connect(PROBE_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")  # nhiều tiến trình kênh đọc/ghi cùng lúc
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS probe ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, duration REAL, info TEXT)"
+        )
+        _local.conn = conn
+    return conn
+
+
+def probe_cached(file_path):
+    """Như probe_video nhưng đọc cache trước; chỉ đọc lại file khi file mới hoặc đã đổi."""
+    try:
+        st = os.stat(file_path)
+    except OSError as e:
+        print(f"Error probing '{file_path}': {e}")
+        return None
+    path = os.path.abspath(file_path)
+    try:
+        row = _db().execute("SELECT size, mtime_ns, info FROM probe WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            info = json.loads(row[2])
+            if "extradata" in info:  # bản ghi cũ chưa có level/extradata thì probe lại
+                return info
+    except sqlite3.Error as e:
+        print(f"[PROBE CACHE] {e}")
+
+    info = probe_video(file_path)
+    if info is not None:
+        try:
+            with _db() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO probe VALUES (?, ?, ?, ?, ?)",
+                    (path, st.st_size, st.st_mtime_ns, info["duration"], json.dumps(info))
+                )
+        except sqlite3.Error as e:
+            print(f"[PROBE CACHE] {e}")
+    return info
+
+
+def probe_duration(file_path):  # return giây (float), None nếu lỗi
+    info = probe_cached(file_path)
+    return info["duration"] if info else None
+
+
+def iter_durations(paths, max_workers=PROBE_WORKERS, report_every=20):
+    """probe_duration song song, trả (path, giây) đúng thứ tự paths và in tiến độ / tốc độ."""
+    total = len(paths)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i, (path, duration) in enumerate(zip(paths, executor.map(probe_duration, paths)), 1):
+            if i % report_every == 0 or i == total:
+                elapsed = time.perf_counter() - start
+                print(f"[PROBE] {i}/{total} file, {elapsed:.1f}s, {i / max(elapsed, 1e-6):.1f} file/s", flush=True)
+            yield path, duration
+
+
+def format_duration(seconds):  # giây -> "m:ss"
+    s = int(seconds)
+    return f"{s // 60}:{s % 60:02}"
+
+
+def _same_rate(rate, fps):
+    try:
+        return Fraction(rate) == Fraction(fps)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return False
+
+
+def matches_spec(info, width=1920, height=1080, fps=30, vcodec="h264", pix_fmt="yuv420p",
+                 acodec="aac", sample_rate=48000, channel_layout="stereo"):
+    """True nếu file đã đúng chuẩn đầu ra của normalize_video (không cần encode lại)."""
+    if not info:
+        return False
+    return (
+        info["video_codec"] == vcodec
+        and info["width"] == width
+        and info["height"] == height
+        and _same_rate(info["fps"], fps)
+        and _same_rate(info["avg_fps"], fps)
+        and info["pix_fmt"] == pix_fmt
+        and info["sar"] in (None, "1:1")
+        and info["audio_codec"] == acodec
+        and info["sample_rate"] == sample_rate
+        and info["channel_layout"] == channel_layout
+    )
@@ -0,0 +1,547 @@
+import os
+import time
+import subprocess
+import shutil
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from video_probe import probe_cached, matches_spec
+import norm_cache
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Tham số normalize chung, cũng là một phần key của cache
+NORMALIZE_PARAMS = dict(width=1920, height=1080, fps=30, use_nvenc=True, cq=23, v_bitrate="12M", a_bitrate="160k")
+
+# Engine ghép: "two_stage" = normalize từng clip (có cache) rồi concat -c copy,
+# "filter_complex" = một lệnh ffmpeg duy nhất, không file trung gian,
+# "pipeline" = normalize ra MPEG-TS và mux dần theo thứ tự trong lúc các clip sau còn đang encode
+ENGINE_TWO_STAGE = "two_stage"
+ENGINE_FILTER = "filter_complex"
+ENGINE_PIPELINE = "pipeline"
+
+# Card NVENC phổ thông giới hạn số phiên encode đồng thời
+NVENC_MAX_SESSIONS = int(os.getenv("NVENC_MAX_SESSIONS", "3"))
+# libx264 tự chia luồng tốt tới khoảng này; ít hơn thì chạy thêm job song song
+X264_THREADS_PER_JOB = int(os.getenv("X264_THREADS_PER_JOB", "8"))
+# Clip dài hơn SPLIT_MIN_SECONDS * 2 được cắt thành nhiều đoạn encode song song (SPLIT_MAX_PARTS=1 để tắt)
+SPLIT_MIN_SECONDS = int(os.getenv("SPLIT_MIN_SECONDS", "600"))
+SPLIT_MAX_PARTS = int(os.getenv("SPLIT_MAX_PARTS", "4"))
+# Nơi đặt thư mục tạm riêng của mỗi job (nên là SSD local); trống = thư mục tạm của hệ thống
+WORK_DIR = os.getenv("CONCAT_WORK_DIR") or None
+
+
+# Số job encode tối đa chạy cùng lúc trên cả máy, dùng chung giữa các tiến trình kênh
+# (main_loop.py đặt biến này cho các script con); 0 = không giới hạn
+ENCODE_SLOTS = int(os.getenv("CONCAT_ENCODE_SLOTS", "0"))
+SLOT_LOCK_DIR = os.path.join(WORK_DIR or tempfile.gettempdir(), "concat_encode_slots")
+NVENC_LOCK_DIR = os.path.join(SLOT_LOCK_DIR, "nvenc")
+# Exit code script kênh trả về khi không có dòng nào cần xử lý, để runner biết mà nghỉ.
+# Chỉ bật khi runner đặt CONCAT_NO_WORK_EXIT=1 (main_loop.py); loop.py / old_loop.py gọi với check=True nên vẫn nhận 0
+NO_WORK_EXIT_CODE = 3
+
+
+def exit_code(did_work):
+    return NO_WORK_EXIT_CODE if not did_work and os.getenv("CONCAT_NO_WORK_EXIT") == "1" else 0
+
+
+def _try_lock(f):
+    try:
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(f):
+    if os.name == "nt":
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _file_slot(lock_dir, count, what):
+    """
+    Giữ một trong `count` suất, mỗi suất là một file lock trong lock_dir; hệ điều
+    hành tự nhả khi tiến trình chết nên không bị kẹt suất.
+    """
+    os.makedirs(lock_dir, exist_ok=True)
+    waited = False
+    while True:
+        for k in range(count):
+            f = open(os.path.join(lock_dir, f"slot_{k}.lock"), "a+b")
+            if _try_lock(f):
+                try:
+                    yield
+                finally:
+                    _unlock(f)
+                    f.close()
+                return
+            f.close()
+        if not waited:
+            print(f"Đang chờ {what} trống ({count} suất)...")
+            waited = True
+        time.sleep(2)
+
+
+def _held_slots(lock_dir, count):  # số suất đang bị giữ (kể cả suất của chính job này)
+    held = 0
+    os.makedirs(lock_dir, exist_ok=True)
+    for k in range(count):
+        with open(os.path.join(lock_dir, f"slot_{k}.lock"), "a+b") as f:
+            if _try_lock(f):
+                _unlock(f)
+            else:
+                held += 1
+    return held
+
+
+@contextmanager
+def encode_slot():
+    """Giữ một trong ENCODE_SLOTS suất encode (job ghép) trên cả máy."""
+    if ENCODE_SLOTS <= 0:
+        yield
+        return
+    with _file_slot(SLOT_LOCK_DIR, ENCODE_SLOTS, "suất encode"):
+        yield
+
+
+@contextmanager
+def nvenc_session(use_nvenc=True):
+    """Mỗi lệnh ffmpeg dùng NVENC giữ một trong NVENC_MAX_SESSIONS phiên, chung cho mọi job trên máy."""
+    if not nvenc_enabled(use_nvenc):
+        yield
+        return
+    with _file_slot(NVENC_LOCK_DIR, NVENC_MAX_SESSIONS, "phiên NVENC"):
+        yield
+
+
+@contextmanager
+def job_workspace(prefix="concat_"):
+    """Thư mục tạm riêng cho một job ghép, luôn được xóa khi xong (kể cả khi lỗi)."""
+    if WORK_DIR:
+        os.makedirs(WORK_DIR, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=prefix, dir=WORK_DIR)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def nvenc_enabled(use_nvenc=True):
+    return bool(use_nvenc and shutil.which("nvidia-smi"))
+
+
+def encode_slots(n_jobs, use_nvenc=True):  # return (số job chạy song song, -threads cho mỗi job)
+    cores = os.cpu_count() or 4
+    if nvenc_enabled(use_nvenc):
+        # giới hạn phiên do nvenc_session() giữ trên cả máy, job chạy một mình được dùng hết
+        workers = NVENC_MAX_SESSIONS
+    else:
+        # chia core cho số job ghép đang chạy lúc này (job chạy một mình được cả máy)
+        if ENCODE_SLOTS > 0:
+            cores = max(1, cores // max(1, _held_slots(SLOT_LOCK_DIR, ENCODE_SLOTS)))
+        workers = cores // X264_THREADS_PER_JOB
+    workers = max(1, min(workers, n_jobs))
+    return workers, max(1, cores // workers)
+
+
+def duration_map(input_videos, durations=None):  # {path: giây}, rỗng nếu không có durations
+    length = {}
+    for path, duration in zip(input_videos, durations or []):
+        length.setdefault(path, duration or 0)
+    return length
+
+
+def longest_first(input_videos, durations=None):
+    """Danh sách clip (không trùng) theo thứ tự encode: clip dài chạy trước để giảm tổng thời gian."""
+    unique = list(dict.fromkeys(input_videos))
+    if not durations:
+        return unique
+    length = duration_map(input_videos, durations)
+    return sorted(unique, key=lambda path: length.get(path, 0), reverse=True)
+
+
+def split_parts(duration, use_nvenc=True):  # số đoạn nên cắt một clip dài
+    # NVENC bị giới hạn số phiên nên không cắt thêm
+    if not duration or nvenc_enabled(use_nvenc):
+        return 1
+    return max(1, min(SPLIT_MAX_PARTS, int(duration // SPLIT_MIN_SECONDS)))
+
+
+def video_encoder_args(use_nvenc=True, cq=23, v_bitrate="12M"):
+    if nvenc_enabled(use_nvenc):
+        return [
+            "-c:v", "h264_nvenc",
+            "-profile:v", "main",
+            "-rc", "cbr",
+            "-cq", str(cq),
+            "-b:v", v_bitrate,
+            "-maxrate", v_bitrate,
+            "-bufsize", str(int(int(v_bitrate[:-1]) * 2)) + "M" if v_bitrate.endswith("M") else "16M",
+            "-preset", "p4",
+        ]
+    return [
+        "-c:v", "libx264",
+        "-preset", "medium",
+        "-profile:v", "main",
+        "-level", "4.2",
+        "-crf", str(cq if isinstance(cq, int) else 20),
+        "-maxrate", v_bitrate,
+        "-bufsize", "16M",
+    ]
+
+
+def normalize_video(
+    input_path,
+    output_path,
+    width=1920,
+    height=1080,
+    fps=30,
+    use_nvenc=True,
+    cq=23,
+    v_bitrate="12M",
+    a_bitrate="160k",
+    threads=None,
+    start_frame=None,
+    frames=None,
+    video=True,
+    audio=True,
+):
+     # Kiểm tra input/output có đúng định dạng string không
+    if not isinstance(input_path, str) or not isinstance(output_path, str):
+        raise TypeError(f"Đường dẫn input/output không hợp lệ: input={input_path}, output={output_path}")
+
+    if not shutil.which("ffmpeg"):
+        raise RuntimeError("ffmpeg không được tìm thấy trong PATH.")
+
+    # start_frame/frames: chỉ encode một đoạn, tính theo frame của lưới fps đầu ra (dùng khi cắt clip dài).
+    # Seek tới trước điểm cắt tối đa 1 giây nhưng giữ timestamp gốc (-copyts) và neo lưới fps vào đúng
+    # biên frame đó, nên frame nào cũng được chọn y như bản encode một lượt; trim bỏ phần đệm rồi đưa về 0.
+    vf = f"scale={width}:{height}:flags=lanczos,fps={fps}"
+    seek = 0
+    if start_frame:
+        preroll = min(start_frame, fps)
+        seek = (start_frame - preroll) / fps
+        vf += f":start_time={seek:.6f},trim=start_frame={preroll},setpts=PTS-STARTPTS"
+
+    video_args = [
+        "-vf", vf,
+        *video_encoder_args(use_nvenc, cq, v_bitrate),
+        *(["-threads", str(threads)] if threads else []),
+        "-pix_fmt", "yuv420p",
+        # "-vsync", "cfr",
+        "-fps_mode", "cfr",
+        "-r", str(fps),
+        *(["-frames:v", str(frames)] if frames else []),
+    ] if video else ["-vn"]
+    audio_args = ["-c:a", "aac", "-ar", "48000", "-b:a", a_bitrate] if audio else ["-an"]
+
+    command = [
+        "ffmpeg", "-y",
+        "-fflags", "+genpts",
+        *(["-ss", f"{seek:.6f}", "-copyts"] if seek else []),
+        "-i", input_path,
+        *video_args,
+        # MPEG-TS (engine pipeline) không dùng movflags
+        *(["-movflags", "+faststart"] if output_path.lower().endswith((".mp4", ".mov")) else []),
+        *audio_args,
+        output_path
+    ]
+
+    with nvenc_session(use_nvenc and video):
+        subprocess.run(command, check=True)
+
+
+def normalize_video_split(input_path, output_path, duration, parts, threads=None, workdir=None, **params):
+    """
+    Cắt phần hình của clip dài thành `parts` đoạn, encode song song rồi nối bằng
+    concat -c copy; tiếng encode một lượt cho cả clip rồi mux vào. Điểm cắt nằm
+    đúng biên frame của fps đầu ra (-ss + -frames:v) và không có AAC priming ở
+    chỗ nối, nên kết quả khớp bản encode một lượt (dùng chung key cache).
+    Tổng số luồng vẫn giữ bằng `threads`.
+    """
+    fps = params.get("fps", 30)
+    step = int(round(duration * fps)) // parts  # số frame mỗi đoạn, đoạn cuối lấy hết phần còn lại
+    has_audio = probe_cached(input_path).get("audio_codec") is not None
+    part_threads = max(1, threads // parts) if threads else None
+    # file đoạn nằm trong thư mục tạm của job, không nằm cạnh output (CACHE_DIR)
+    folder = tempfile.mkdtemp(prefix="split_", dir=workdir)
+    segments = [os.path.join(folder, f"seg{k}.mp4") for k in range(parts)]
+    video_file = os.path.join(folder, "video.mp4")
+    audio_file = os.path.join(folder, "audio.m4a")
+    try:
+        with ThreadPoolExecutor(max_workers=parts + 1) as executor:
+            futures = [
+                executor.submit(
+                    normalize_video, input_path, segment, threads=part_threads,
+                    start_frame=k * step,
+                    frames=None if k == parts - 1 else step,
+                    audio=False, **params
+                )
+                for k, segment in enumerate(segments)
+            ]
+            if has_audio:
+                futures.append(executor.submit(normalize_video, input_path, audio_file, video=False, **params))
+            for future in futures:
+                future.result()
+        concat_video(segments, video_file, folder)
+        subprocess.run([
+            "ffmpeg", "-y",
+            "-i", video_file,
+            *(["-i", audio_file] if has_audio else []),
+            "-map", "0:v", *(["-map", "1:a"] if has_audio else []),
+            "-c", "copy",
+            "-movflags", "+faststart",
+            output_path
+        ], check=True)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def concat_video(video_paths, output_path, workdir=None):
+    if workdir is None:
+        with job_workspace() as workdir:
+            return concat_video(video_paths, output_path, workdir)
+
+    # tên riêng vì nhiều concat (vd. nối đoạn của các clip dài) có thể chạy cùng lúc trong một workdir
+    fd, list_file = tempfile.mkstemp(prefix="concat_", suffix=".txt", dir=workdir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for path in video_paths:
+            abs_path = os.path.abspath(path).replace("\\", "/")
+            # concat demuxer: dấu ' trong tên file (vd. "Bluey's house") phải viết thành '\''
+            abs_path = abs_path.replace("'", "'\\''")
+            f.write(f"file '{abs_path}'\n")
+
+    command = [
+        "ffmpeg", "-y",
+        "-f", "concat", "-safe", "0",
+        "-i", list_file,
+        "-c", "copy",
+        output_path
+    ]
+    subprocess.run(command, check=True)
+    os.remove(list_file)
+
+
+def can_stream_copy(input_videos, width=1920, height=1080, fps=30):
+    """
+    True khi mọi input đã đúng chuẩn của normalize_video và giống nhau về
+    profile/level/timebase/extradata, để concat demuxer ghép thẳng bằng -c copy.
+    """
+    if not input_videos:
+        return False
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        infos = list(executor.map(probe_cached, input_videos))
+
+    if not all(matches_spec(info, width, height, fps) for info in infos):
+        return False
+    # concat -c copy cần timebase và SPS/PPS giống nhau giữa các file: concat demuxer chỉ giữ
+    # extradata của file đầu, nên extradata (avcC) khác hoặc không đọc được thì encode lại
+    if any(info.get("extradata") is None for info in infos):
+        return False
+    keys = {(info["profile"], info["level"], info["time_base"], info["extradata"]) for info in infos}
+    return len(keys) == 1
+
+
+def normalize_auto(path, output_path, threads=None, duration=None, workdir=None):  # clip dài thì cắt đoạn encode song song
+    parts = split_parts(duration, NORMALIZE_PARAMS["use_nvenc"])
+    if parts > 1:
+        print(f"Cắt {path} ({int(duration)}s) thành {parts} đoạn để encode song song")
+        normalize_video_split(path, output_path, duration, parts, threads=threads, workdir=workdir, **NORMALIZE_PARAMS)
+    else:
+        normalize_video(path, output_path, threads=threads, **NORMALIZE_PARAMS)
+
+
+def normalize_cached(path, in_use, threads=None, duration=None, workdir=None):  # return path đã normalize (lấy từ cache nếu có)
+    cached = norm_cache.lookup(path, NORMALIZE_PARAMS)
+    if cached:
+        print(f"Dùng lại bản normalize trong cache: {path}")
+        in_use.add(cached)
+        return cached
+    tmp = norm_cache.temp_path(path, NORMALIZE_PARAMS)
+    try:
+        normalize_auto(path, tmp, threads, duration, workdir)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    # in_use: các file cache job này đang dùng, không được evict
+    cached = norm_cache.store(path, NORMALIZE_PARAMS, tmp, keep=in_use)
+    in_use.add(cached)
+    return cached
+
+
+def concat_filter(
+    input_videos,
+    output_path,
+    width=1920,
+    height=1080,
+    fps=30,
+    use_nvenc=True,
+    cq=23,
+    v_bitrate="12M",
+    a_bitrate="160k",
+):
+    """
+    Ghép bằng một lệnh ffmpeg duy nhất: mỗi input được scale/fps/aresample trong
+    filter_complex rồi đưa vào filter concat, decode một lần và encode một lần,
+    không tạo file trung gian. Mọi input phải có cả video lẫn audio.
+    """
+    if not shutil.which("ffmpeg"):
+        raise RuntimeError("ffmpeg không được tìm thấy trong PATH.")
+
+    inputs = []
+    chains = []
+    pads = []
+    for i, path in enumerate(input_videos):
+        inputs += ["-i", path]
+        chains.append(f"[{i}:v:0]scale={width}:{height}:flags=lanczos,setsar=1,fps={fps},format=yuv420p[v{i}]")
+        chains.append(f"[{i}:a:0]aresample=48000,aformat=sample_fmts=fltp:channel_layouts=stereo[a{i}]")
+        pads.append(f"[v{i}][a{i}]")
+    chains.append(f"{''.join(pads)}concat=n={len(input_videos)}:v=1:a=1[v][a]")
+
+    command = [
+        "ffmpeg", "-y",
+        *inputs,
+        "-filter_complex", ";".join(chains),
+        "-map", "[v]", "-map", "[a]",
+        *video_encoder_args(use_nvenc, cq, v_bitrate),
+        "-pix_fmt", "yuv420p",
+        "-fps_mode", "cfr",
+        "-r", str(fps),
+        "-movflags", "+faststart",
+        "-c:a", "aac",
+        "-ar", "48000",
+        "-b:a", a_bitrate,
+        output_path
+    ]
+    with nvenc_session(use_nvenc):
+        subprocess.run(command, check=True)
+
+
+def concat_two_stage(input_videos, output_path, workdir, use_cache=True, durations=None):  # normalize từng clip rồi concat -c copy
+    # mỗi clip chỉ normalize một lần kể cả khi lặp lại trong danh sách
+    order = longest_first(input_videos, durations)
+    length = duration_map(input_videos, durations)
+    workers, threads = encode_slots(len(order), NORMALIZE_PARAMS["use_nvenc"])
+    print(f"Normalize {len(order)} clip: {workers} job song song, {threads} luồng/job")
+
+    if use_cache:
+        in_use = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                path: executor.submit(normalize_cached, path, in_use, threads, length.get(path), workdir)
+                for path in order
+            }
+            done = {path: future.result() for path, future in futures.items()}
+        concat_video([done[path] for path in input_videos], output_path, workdir)
+        return
+
+    def normalize_and_collect(i, path):
+        fixed = os.path.join(workdir, f"normalized_{i}.mp4")
+        normalize_auto(path, fixed, threads, length.get(path), workdir)
+        return fixed
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {path: executor.submit(normalize_and_collect, i, path) for i, path in enumerate(order)}
+        done = {path: future.result() for path, future in futures.items()}
+
+    concat_video([done[path] for path in input_videos], output_path, workdir)
+
+
+def packet_span(path):
+    """
+    return (pts đầu, pts cuối + duration) tính trên mọi stream, đơn vị giây.
+    Không dùng format=duration: với MPEG-TS nó chỉ ước lượng theo một stream nên
+    có thể hụt phần tiếng dài hơn hình vài chục ms.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "packet=pts_time,duration_time", "-of", "csv=p=0", path],
+        capture_output=True, text=True, check=True
+    )
+    start = end = None
+    for line in result.stdout.splitlines():
+        fields = line.strip().strip(",").split(",")
+        try:
+            pts, duration = float(fields[0]), float(fields[1])
+        except (IndexError, ValueError):
+            continue  # N/A
+        start = pts if start is None else min(start, pts)
+        end = pts + duration if end is None else max(end, pts + duration)
+    if start is None:
+        raise RuntimeError(f"Không đọc được packet nào từ {path}")
+    return start, end
+
+
+def concat_pipeline(input_videos, output_path, workdir):
+    """
+    Normalize từng clip ra MPEG-TS, clip nào xong (đúng thứ tự) thì đẩy ngay vào
+    stdin của một tiến trình ffmpeg mux -c copy, nên việc ghép chạy song song với
+    các clip còn lại và file đầu ra xong vài giây sau clip cuối. Mỗi đoạn TS bắt đầu
+    lại từ ~0 nên được remux -c copy với -output_ts_offset nối tiếp điểm kết thúc
+    của đoạn trước rồi mới đẩy vào mux (ffmpeg chỉ tự bù khi timestamp nhảy quá
+    dts_delta_threshold 10s, clip ngắn hơn sẽ bị DTS lùi / lệch tiếng).
+    """
+    # Giữ đúng thứ tự playlist (không xếp clip dài trước) để mux được sớm nhất
+    segments = [os.path.join(workdir, f"segment_{i}.ts") for i in range(len(input_videos))]
+    workers, threads = encode_slots(len(input_videos), NORMALIZE_PARAMS["use_nvenc"])
+    mux = subprocess.Popen(
+        ["ffmpeg", "-y", "-f", "mpegts", "-i", "pipe:0",
+         "-c", "copy", "-bsf:a", "aac_adtstoasc", "-movflags", "+faststart", output_path],
+        stdin=subprocess.PIPE
+    )
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(normalize_video, path, segment, threads=threads, **NORMALIZE_PARAMS)
+                for path, segment in zip(input_videos, segments)
+            ]
+            position = None  # timestamp (giây) mà đoạn kế tiếp phải bắt đầu
+            for future, segment in zip(futures, segments):
+                future.result()
+                start, end = packet_span(segment)
+                position = start if position is None else position
+                # -copyts: giữ timestamp gốc rồi dời đúng một lượng, không để ffmpeg tự dời về 0
+                subprocess.run(
+                    ["ffmpeg", "-v", "error", "-copyts", "-i", segment, "-map", "0", "-c", "copy",
+                     "-output_ts_offset", f"{position - start:.6f}", "-f", "mpegts", "pipe:1"],
+                    stdout=mux.stdin, check=True
+                )
+                position += end - start
+                os.remove(segment)
+        mux.stdin.close()
+        if mux.wait() != 0:
+            raise subprocess.CalledProcessError(mux.returncode, mux.args)
+    except Exception:
+        mux.kill()
+        mux.wait()
+        raise
+
+
+def auto_concat(input_videos, output_path, use_cache=True, engine=ENGINE_TWO_STAGE, durations=None):
+    # durations (giây, cùng thứ tự input_videos) dùng để xếp clip dài encode trước
+    # Mọi file trung gian nằm trong thư mục tạm riêng của job nên nhiều kênh chạy song song được
+    with encode_slot(), job_workspace() as workdir:
+        if can_stream_copy(input_videos):
+            print("Tất cả video đã đúng chuẩn, ghép trực tiếp (-c copy) không encode lại.")
+            concat_video(input_videos, output_path, workdir)
+        elif engine == ENGINE_TWO_STAGE:
+            concat_two_stage(input_videos, output_path, workdir, use_cache, durations)
+        elif engine == ENGINE_FILTER:
+            concat_filter(input_videos, output_path, **NORMALIZE_PARAMS)
+        elif engine == ENGINE_PIPELINE:
+            concat_pipeline(input_videos, output_path, workdir)
+        else:
+            raise ValueError(f"Engine ghép không hợp lệ: {engine}")
+
+    print("Ghép video hoàn tất:", output_path)
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+from update_data import ScanIncomplete, scan_files, sync, load_manifest, manifest_path, log
+
+# Chạy nền, giữ các catalog ref/*.csv luôn khớp với thư mục video của từng kênh (không cần mở GUI).
+# Nguồn là share SMB nên dùng polling: mỗi POLL_SECONDS quét lại, file chỉ được đưa vào catalog khi
+# size/mtime không đổi giữa hai lần quét và đã cũ hơn STABLE_SECONDS (tránh probe file đang copy dở).
+REF_DIR = r"C:\Users\Admin\Documents\concatenate videos\ref"
+POLL_SECONDS = int(os.getenv("CATALOG_POLL_SECONDS", "120"))
+STABLE_SECONDS = int(os.getenv("CATALOG_STABLE_SECONDS", "60"))
+
+# kênh -> (thư mục video, file catalog). Spidey không có ở đây: catalog spidey đánh số theo tập,
+# do check_and_add_next_spidey_videos thêm dần.
+CHANNELS = {
+    'be_ca': (r"\\nashp\DATABUHP\.HP_PROJECTs\.vid_Hoàn thiện_ Lưu\Bé Cá", "beca_data.csv"),
+    'bluey': (r"\\nashp\DATABUHP\.HP_PROJECTs\.vid_Hoàn thiện_ Lưu\Bluey", "bluey_data.csv"),
+    'bluey_funtoys': (r"\\nashp\DATABUHP\.HP_PROJECTs\Bluey Khai thác\.Bluey Funtoys\.Đa Up", "bluey_funtoys_data.csv"),
+    'findtoys': (r"\\Fmc\E\Findtoys", "findtoys_data.csv"),
+    'maycay': (r"\\Fmc\E\may cay", "maycay_data.csv"),
+    'drive': (r"H:\My Drive\test concat", "drive_data.csv"),
+}
+
+
+def stable_files(files, previous, now):  # chỉ giữ file không đổi từ lần quét trước và đủ cũ
+    return {
+        path: stat for path, stat in files.items()
+        if previous.get(path) == stat and now - stat[1] / 1e9 >= STABLE_SECONDS
+    }
+
+
+def poll_channel(name, folder, output_file, state):
+    if not os.path.isdir(folder):
+        log(f"[{name}] Không truy cập được {folder}, bỏ qua lần này.")
+        return
+    try:
+        files = scan_files(folder)
+    except ScanIncomplete as e:  # giữ nguyên state và catalog, lần poll sau quét lại
+        log(f"[{name}] {e}, bỏ qua lần này.")
+        return
+    previous = state.get(name)
+    state[name] = files
+    if previous is None:
+        return  # lần quét đầu chỉ ghi nhận, lần sau mới so sánh
+
+    stable = stable_files(files, previous, time.time())
+    pending = len(files) - len(stable)
+    synced = {path: tuple(entry[:2]) for path, entry in load_manifest(manifest_path(output_file)).items()}
+    if stable == synced:
+        if pending:
+            log(f"[{name}] {pending} file đang thay đổi, chờ ổn định.")
+        return
+    if not stable and synced:
+        log(f"[{name}] Quét được 0 file ổn định (NAS lỗi?), không ghi đè catalog.")
+        return
+
+    log(f"[{name}] Có thay đổi, cập nhật {os.path.basename(output_file)}"
+        f"{f' ({pending} file chờ ổn định)' if pending else ''}")
+    sync(folder, output_file, files=stable)
+
+
+def main(channel_names):
+    state = {}
+    log(f"Theo dõi: {', '.join(channel_names)} (mỗi {POLL_SECONDS}s)")
+    while True:
+        for name in channel_names:
+            folder, csv_name = CHANNELS[name]
+            try:
+                poll_channel(name, folder, os.path.join(REF_DIR, csv_name), state)
+            except Exception as e:
+                log(f"[{name}] Lỗi: {e}")
+        time.sleep(POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(CHANNELS)
+    unknown = [n for n in names if n not in CHANNELS]
+    if unknown:
+        log(f"Kênh không hợp lệ: {', '.join(unknown)}. Có: {', '.join(CHANNELS)}")
+        sys.exit(1)
+    main(names)
@@ -1,11 +1,16 @@
 import pandas as pd
 import os
+import sys
 from tkinter import filedialog, Tk, messagebox
 from datetime import datetime
-from moviepy import VideoFileClip
 import gspread
 from google.oauth2.service_account import Credentials
 
+# đọc thời lượng từ header qua cache probe dùng chung với main/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+from video_probe import probe_duration, format_duration
+from catalog import atomic_write, BatchWriter
+
 # Constants
 EXCEL_FILE = 'Auto_edit_vids.xlsx'
 VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov'}
@@ -35,16 +40,10 @@ def get_file_list(folder_path, extensions=None):
         return []
 
 def get_video_duration(file_path):
-    try:
-        with VideoFileClip(file_path) as video:
-            minute = int(round(video.duration)) // 60
-            sec = int(round(video.duration)) % 60
-            if sec < 10:
-                sec = f'0{sec}'
-            return f'{minute}:{sec}'
-    except Exception as e:
-        print(f"Error getting duration for '{file_path}': {e}")
+    duration = probe_duration(file_path)
+    if duration is None:
         return "0:00"
+    return format_duration(round(duration))
 
 def get_creation_time(file_path):
     try:
@@ -65,17 +64,20 @@ def get_last_stt(excel_file):
         print(f"Error reading Excel file '{excel_file}': {e}")
         return 0
 
+def append_rows_to_excel(excel_file, rows):  # đọc file một lần cho cả batch, ghi qua file tạm
+    columns = ['stt', 'file_path', 'duration', 'lastest_used_value', 'first vids',
+               'desired length', 'output directory', 'number_of_vids', 'status']
+    new_rows = pd.DataFrame(rows, columns=columns)
+    if os.path.exists(excel_file):
+        df = pd.read_excel(excel_file, engine='openpyxl')
+        df = pd.concat([df, new_rows], ignore_index=True)
+    else:
+        df = new_rows
+    atomic_write(excel_file, lambda tmp: df.to_excel(tmp, index=False, engine='openpyxl'))
+
 def append_to_excel(excel_file, values):
     try:
-        columns = ['stt', 'file_path', 'duration', 'lastest_used_value', 'first vids',
-                   'desired length', 'output directory', 'number_of_vids', 'status']
-        new_row = pd.DataFrame([values], columns=columns)
-        if os.path.exists(excel_file):
-            df = pd.read_excel(excel_file, engine='openpyxl')
-            df = pd.concat([df, new_row], ignore_index=True)
-        else:
-            df = new_row
-        df.to_excel(excel_file, index=False, engine='openpyxl')
+        append_rows_to_excel(excel_file, [values])
     except Exception as e:
         print(f"Error writing to Excel file '{excel_file}': {e}")
 
@@ -90,16 +92,14 @@ def update_ggsheet(gspread_client, sheet_name):
     worksheet.format("1:1", {"textFormat": {"bold": True}})
     print("Saved all Excel content into Google Sheet!")
 
-def process_file(file_path, stt):
+def process_file(file_path, stt, writer=None):
     duration = get_video_duration(file_path)
     creation_time = get_creation_time(file_path)
-    append_to_excel(EXCEL_FILE, [
-        stt,
-        file_path,
-        duration,
-        creation_time,
-        None, None, None, 1, None
-    ])
+    row = [stt, file_path, duration, creation_time, None, None, None, 1, None]
+    if writer is None:
+        append_to_excel(EXCEL_FILE, row)
+    else:
+        writer.add(row)
     print(f"Added to excel: {file_path}")
 
 def main():
@@ -136,13 +136,14 @@ def main():
     else:
         stt = get_last_stt(EXCEL_FILE) + 1
 
-    # Ghi dữ liệu
-    for file_path in video_files:
-        if is_new_mode or file_path not in existing_paths:
-            process_file(file_path, stt)
-            stt += 1
-        else:
-            print(f"Bỏ qua (đã có): {file_path}")
+    # Ghi dữ liệu: gom lại, ghi Excel một lần
+    with BatchWriter(EXCEL_FILE, append_rows_to_excel, flush_every=None) as writer:
+        for file_path in video_files:
+            if is_new_mode or file_path not in existing_paths:
+                process_file(file_path, stt, writer)
+                stt += 1
+            else:
+                print(f"Bỏ qua (đã có): {file_path}")
 
     # Ghi lên Google Sheet
     creds = Credentials.from_service_account_file(CREDS_FILE, scopes=SCOPES)
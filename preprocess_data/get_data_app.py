@@ -2,14 +2,14 @@ import pandas as pd
 import os
 from tkinter import filedialog, Tk, Button, Label, Frame, messagebox
 from datetime import datetime
-from moviepy import VideoFileClip
-import warnings
 import threading
-import subprocess
+import sys
 
+# dùng chung cache probe với các script trong main/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+from video_probe import probe_duration, format_duration, iter_durations
+from catalog import append_rows_csv, BatchWriter
 
-# Suppress the specific moviepy subtitle warning
-warnings.filterwarnings("ignore", message="Subtitle stream parsing is not supported by moviepy")
 
 # Constants
 OUTPUT_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\beca_data.csv"
@@ -36,26 +36,10 @@ def get_file_list(folder_path, extensions=None):
         return []
 
 def get_video_duration(file_path):
-    try:
-        result = subprocess.run(
-            [
-                "ffprobe", "-v", "error", "-show_entries",
-                "format=duration", "-of",
-                "default=noprint_wrappers=1:nokey=1", file_path
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            timeout=100  # tránh treo mãi
-        )
-        duration_sec = float(result.stdout.decode().strip())
-        minute = int(duration_sec) // 60
-        sec = int(duration_sec) % 60
-        if sec < 10:
-            sec = f"0{sec}"
-        return f"{minute}:{sec}"
-    except Exception as e:
-        print(f"Error getting duration for '{file_path}': {e}")
+    duration = probe_duration(file_path)
+    if duration is None:
         return "0:00"
+    return format_duration(duration)
 
 def get_creation_time(file_path):
     try:
@@ -76,50 +60,28 @@ def get_last_stt(output_file):
         print(f"Error reading CSV file '{output_file}': {e}")
         return 0
 
-def append_to_csv(output_file, values):
+def append_to_csv(output_file, values):  # ghi ngay một dòng; quét cả thư mục thì dùng BatchWriter
     try:
-        columns = ['stt', 'file_path', 'duration', 'lastest_used_value']
-        new_row = pd.DataFrame([values], columns=columns)
-        if os.path.exists(output_file):
-            df = pd.read_csv(output_file, encoding='utf-8-sig')
-            # Ensure only desired columns are kept
-            if set(columns).issubset(df.columns):
-                df = df[columns]  # Keep only the desired columns if they exist
-            df = pd.concat([df, new_row], ignore_index=True)
-        else:
-            df = new_row
-        df.to_csv(output_file, index=False, encoding='utf-8-sig')
+        append_rows_csv(output_file, [values])
     except Exception as e:
         print(f"Error writing to CSV file '{output_file}': {e}")
 
-def process_file(file_path, stt):
+def process_file(file_path, stt, duration_sec=None, writer=None):
     try:
-        result = subprocess.run(
-            [
-                "ffprobe", "-v", "error", "-show_entries",
-                "format=duration", "-of",
-                "default=noprint_wrappers=1:nokey=1", file_path
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            timeout=100
-        )
-        duration_sec = float(result.stdout.decode().strip())
+        if duration_sec is None:
+            duration_sec = probe_duration(file_path)
+        if duration_sec is None:
+            return
         if duration_sec < 60:
             print(f"Skipped (under 1 min): {file_path}")
             return
-        minute = int(duration_sec) // 60
-        sec = int(duration_sec) % 60
-        if sec < 10:
-            sec = f"0{sec}"
-        duration_str = f"{minute}:{sec}"
+        duration_str = format_duration(duration_sec)
         creation_time = get_creation_time(file_path)
-        append_to_csv(OUTPUT_FILE, [
-            stt,
-            file_path,
-            duration_str,
-            creation_time
-        ])
+        row = [stt, file_path, duration_str, creation_time]
+        if writer is None:
+            append_to_csv(OUTPUT_FILE, row)
+        else:
+            writer.add(row)
         print(f"Added to CSV: {file_path}")
     except Exception as e:
         print(f"Error processing file '{file_path}': {e}")
@@ -154,14 +116,19 @@ def run_mode(is_new_mode):
     else:
         stt = get_last_stt(OUTPUT_FILE) + 1
 
-    # Process files
+    # Process files: probe song song, ghi theo đúng thứ tự stt
+    to_process = []
     for file_path in video_files:
         if is_new_mode or file_path not in existing_paths:
-            process_file(file_path, stt)
-            stt += 1
+            to_process.append(file_path)
         else:
             print(f"Skipped (already exists): {file_path}")
 
+    with BatchWriter(OUTPUT_FILE) as writer:
+        for file_path, duration_sec in iter_durations(to_process):
+            process_file(file_path, stt, duration_sec, writer)
+            stt += 1
+
     messagebox.showinfo("Success", f"Processing complete! Data saved to {OUTPUT_FILE}")
     root.destroy()
 
@@ -1,47 +1,66 @@
 import os
 import sys
 import csv
-import subprocess
+import json
 from datetime import datetime
 import pandas as pd
 
+# dùng chung cache probe với các script trong main/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main"))
+from video_probe import probe_duration, iter_durations
+from catalog import atomic_write
+
 OUTPUT_FILE = r"C:\Users\Admin\Documents\concatenate videos\ref\bluey_funtoys_data.csv"
 VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov'}
 
 def log(msg: str):
     print(msg, flush=True)
 
+class ScanIncomplete(OSError):
+    """Có thư mục không đọc được: kết quả quét thiếu, không được dùng để xóa dòng catalog."""
+
+def scan_files(folder_path):  # return {path: (size, mtime_ns)}; stat lấy luôn từ scandir, không tốn thêm round trip SMB
+    found = {}
+    failed = []
+    stack = [folder_path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError as e:
+            log(f"Lỗi quét folder: {e}")
+            failed.append(current)
+            continue
+        skip_files = 'quay' in os.path.basename(current).lower()
+        for entry in entries:
+            if entry.is_dir():
+                stack.append(entry.path)
+            elif not skip_files and os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS:
+                st = entry.stat()
+                found[os.path.abspath(entry.path)] = (st.st_size, st.st_mtime_ns)
+    if failed:
+        # SMB chập chờn: nếu coi như quét đủ thì sync sẽ xóa mọi dòng nằm dưới các thư mục này
+        raise ScanIncomplete(f"Không quét được {len(failed)} thư mục: {', '.join(failed[:5])}")
+    return found
+
 def get_file_list(folder_path):
-    try:
-        file_list = []
-        for root, _, files in os.walk(folder_path):
-            if 'quay' in os.path.basename(root).lower():
-                continue
-            for item in files:
-                if os.path.splitext(item)[1].lower() in VIDEO_EXTENSIONS:
-                    file_list.append(os.path.abspath(os.path.join(root, item)))
-        return file_list
-    except Exception as e:
-        log(f"Lỗi quét folder: {e}")
-        return []
+    return list(scan_files(folder_path))
 
 def ffprobe_duration_seconds(file_path):
-    try:
-        result = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
-             "-of", "default=noprint_wrappers=1:nokey=1", file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            timeout=60
-        )
-        return float(result.stdout.decode(errors="ignore").strip())
-    except:
-        return None
+    return probe_duration(file_path)
 
 def format_mmss(seconds):
     s = int(seconds)
     return f"{s//60}:{s%60:02d}"
 
+def parse_mmss(value):
+    try:
+        minute, sec = str(value).split(':')
+        return int(minute) * 60 + int(sec)
+    except (ValueError, AttributeError):
+        return None
+
 def get_creation_age_seconds(file_path):
     try:
         return int(datetime.now().timestamp() - os.path.getmtime(file_path))
@@ -62,49 +81,100 @@ def read_existing_csv(path):
         return pd.DataFrame(columns=cols)
 
 def write_csv(path, df):
-    df.to_csv(path, index=False, encoding='utf-8-sig', quoting=csv.QUOTE_MINIMAL)
+    atomic_write(path, lambda tmp: df.to_csv(tmp, index=False, encoding='utf-8-sig', quoting=csv.QUOTE_MINIMAL))
 
-def build_rows(folder):
-    files = sorted(get_file_list(folder), key=lambda p: os.path.basename(p).lower())
+# Manifest lần quét trước: path -> [size, mtime_ns, duration giây]. File không đổi size/mtime thì không probe lại.
+def manifest_path(output_file):
+    return os.path.splitext(output_file)[0] + ".manifest.json"
+
+def load_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(path, manifest):
+    def write(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+    atomic_write(path, write)
+
+def build_rows(folder, manifest=None, known=None, files=None):
+    """
+    manifest: kết quả lần quét trước; known: {path: giây} lấy từ CSV cũ khi chưa có manifest;
+    files: kết quả scan_files có sẵn (watcher đã lọc file đang copy dở).
+    Chỉ probe file mới hoặc đã đổi size/mtime. return (rows, manifest mới, danh sách file đã probe)
+    """
+    manifest = manifest or {}
+    known = known or {}
+    if files is None:
+        files = scan_files(folder)
+    durations, to_probe = {}, []
+    for fp, (size, mtime) in files.items():
+        entry = manifest.get(fp)
+        if entry and entry[0] == size and entry[1] == mtime and entry[2] is not None:
+            durations[fp] = entry[2]
+        elif entry is None and known.get(fp) is not None:
+            durations[fp] = known[fp]
+        else:
+            to_probe.append(fp)
+
+    log(f"Quét {len(files)} file, cần probe {len(to_probe)} file mới/thay đổi...")
+    for fp, dur in iter_durations(sorted(to_probe)):
+        durations[fp] = dur
+
+    now = datetime.now().timestamp()
+    new_manifest = {fp: [size, mtime, durations[fp]] for fp, (size, mtime) in files.items()}
     rows = []
-    for fp in files:
-        log(f"Đang xử lý: {fp}")
-        dur = ffprobe_duration_seconds(fp)
+    for fp in sorted(files, key=lambda p: os.path.basename(p).lower()):
+        dur = durations[fp]
         if not dur or dur < 60:
             continue
         rows.append({
             'stt': None,
             'file_path': fp,
             'duration': format_mmss(dur),
-            'lastest_used_value': get_creation_age_seconds(fp) or ""
+            'lastest_used_value': int(now - files[fp][1] / 1e9) or ""
         })
-    return rows
+    return rows, new_manifest, to_probe
+
+def sync(folder, output_file=OUTPUT_FILE, files=None):
+    df_cur = read_existing_csv(output_file)
+    mpath = manifest_path(output_file)
+    manifest = load_manifest(mpath)
+    known = {}
+    if not manifest:  # lần đầu: tin thời lượng trong CSV hiện có
+        known = {fp: parse_mmss(d) for fp, d in zip(df_cur['file_path'], df_cur['duration']) if isinstance(fp, str)}
 
-def sync(folder):
-    df_cur = read_existing_csv(OUTPUT_FILE)
-    desired = build_rows(folder)
+    desired, new_manifest, probed = build_rows(folder, manifest, known, files)
     desired_paths = {r['file_path'] for r in desired}
     cur_paths = set(df_cur['file_path'].dropna().tolist())
 
     to_add = desired_paths - cur_paths
     to_remove = cur_paths - desired_paths
+    changed = [fp for fp in probed if fp in manifest]
 
-    final = {r['file_path']: r for r in desired}
-
-    rows = list(final.values())
-    rows.sort(key=lambda r: os.path.basename(r['file_path']).lower())
+    rows = desired
     for i, r in enumerate(rows, 1):
         r['stt'] = i
     df_final = pd.DataFrame(rows, columns=['stt', 'file_path', 'duration', 'lastest_used_value'])
-    write_csv(OUTPUT_FILE, df_final)
+    write_csv(output_file, df_final)
+    save_manifest(mpath, new_manifest)
 
-    log(f"Tổng: {len(rows)}, Thêm: {len(to_add)}, Xóa: {len(to_remove)}")
+    log(f"Tổng: {len(rows)}, Thêm: {len(to_add)}, Xóa: {len(to_remove)}, Đổi: {len(changed)}")
     if to_add: log(" + " + "\n + ".join(to_add))
     if to_remove: log(" - " + "\n - ".join(to_remove))
+    if changed: log(" ~ " + "\n ~ ".join(changed))
+    return {'total': len(rows), 'added': len(to_add), 'removed': len(to_remove), 'changed': len(changed)}
 
 if __name__ == "__main__":
     folder = input("Nhập đường dẫn thư mục video: ").strip('"').strip("'")
     if not os.path.isdir(folder):
         log("Không phải thư mục hợp lệ.")
         sys.exit(1)
-    sync(folder)
+    try:
+        sync(folder)
+    except ScanIncomplete as e:
+        log(f"{e}. Không cập nhật catalog, hãy chạy lại.")
+        sys.exit(1)